@@ -0,0 +1,77 @@
+import pandas as pd
+import streamlit as st
+
+from result_cache import cached_result
+
+# Robust statistics are kept per vehicle and origin-destination pair
+ANOMALY_KEYS = ['Registration', 'Start Location', 'End Location']
+# Metric columns and the score column each one produces
+ANOMALY_METRICS = {'Distance': 'Distance Score', 'Duration (min)': 'Duration Score'}
+# Smallest MAD allowed per metric, so routes driven identically every time (or parked at 0 km) do not divide by zero
+ANOMALY_MAD_FLOOR = {'Distance': 0.5, 'Duration (min)': 2}
+# Rolling window of most recent trips on the same route used as the baseline, and the trips needed before a pair is scored
+ANOMALY_WINDOW = 20
+ANOMALY_MIN_TRIPS = 5
+# Modified z-score above which a trip is flagged as suspicious
+ANOMALY_THRESHOLD = 3.5
+
+
+# Function to calculate the rolling median of the given columns per vehicle and origin-destination pair
+def calculate_rolling_group_median(df, columns, window, min_trips):
+    rolling_median = df.groupby(ANOMALY_KEYS, sort=False).rolling(window, min_periods=min_trips)[columns].median()
+    # Drop the group keys so the result lines up with the trip table again
+    rolling_median = rolling_median.reset_index(level=list(range(len(ANOMALY_KEYS))), drop=True)
+    return rolling_median.reindex(df.index)
+
+
+# Function to score every trip in the fleet history against its own route baseline, cached per dataset version
+@cached_result
+def calculate_anomaly_scores(df, window=ANOMALY_WINDOW, min_trips=ANOMALY_MIN_TRIPS, threshold=ANOMALY_THRESHOLD):
+    # Rolling windows follow each route's trips in Start Time order
+    scored_df = df.sort_values('Start Time', kind='mergesort').copy()
+    scored_df['Duration (min)'] = (scored_df['End Time'] - scored_df['Start Time']).dt.total_seconds() / 60
+    metrics = list(ANOMALY_METRICS)
+
+    # One grouped pass for the medians, one for the median absolute deviations
+    median = calculate_rolling_group_median(scored_df, metrics, window, min_trips)
+    deviation = (scored_df[metrics] - median).abs()
+    deviation_df = pd.concat([scored_df[ANOMALY_KEYS], deviation], axis=1)
+    mad = calculate_rolling_group_median(deviation_df, metrics, window, min_trips)
+
+    for metric, mad_floor in ANOMALY_MAD_FLOOR.items():
+        mad[metric] = mad[metric].clip(lower=mad_floor)
+    # Trips on routes without enough history yet have no baseline and score 0
+    scores = (0.6745 * deviation / mad).fillna(0)
+
+    for metric, score_column in ANOMALY_METRICS.items():
+        scored_df[score_column] = scores[metric].round(2)
+    scored_df['Anomaly Score'] = scored_df[list(ANOMALY_METRICS.values())].max(axis=1)
+    scored_df['Suspicious'] = scored_df['Anomaly Score'] > threshold
+    return scored_df
+
+
+# Function to build the suspicious trips view, sorted once so that top-N retrieval is a slice
+@cached_result
+def build_suspicious_trips(scored_df):
+    suspicious_df = scored_df[scored_df['Suspicious']]
+    return suspicious_df.sort_values('Anomaly Score', ascending=False, kind='mergesort').reset_index(drop=True)
+
+
+# Function to get the N most suspicious trips, optionally for one registration number
+def get_top_suspicious_trips(suspicious_df, top_n, selected_registration=None):
+    if selected_registration is not None:
+        suspicious_df = suspicious_df[suspicious_df['Registration'] == selected_registration]
+    return suspicious_df.head(top_n)
+
+
+def draw_suspicious_trips(suspicious_df, total_trips, selected_registration, top_n):
+    st.subheader("Suspicious Trips:")
+    st.write(f"{len(suspicious_df)} of {total_trips} trips scored above {ANOMALY_THRESHOLD} against their route baseline.")
+
+    top_suspicious_df = get_top_suspicious_trips(suspicious_df, top_n, selected_registration)
+    if top_suspicious_df.empty:
+        st.warning("No suspicious trips found for the selected registration number.")
+        return
+
+    suspicious_table = top_suspicious_df[['Registration', 'Start Time', 'Start Location', 'End Location', 'Distance', 'Duration (min)', 'Distance Score', 'Duration Score', 'Anomaly Score']]
+    st.table(suspicious_table)
@@ -1,9 +1,30 @@
+import os
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
 import streamlit as st
 import networkx as nx
 import calendar
+from anomaly import calculate_anomaly_scores, build_suspicious_trips, draw_suspicious_trips
+from ledger import DEFAULT_COST_RATES, LEDGER_GRAINS, calculate_cost_ledger, calculate_fuel_cost_series, draw_cost_ledger
+from sampling import build_stratified_sample, estimate_fuel_costs, submit_exact_result
+from result_cache import cached_result, get_dataset_version, set_dataset_version, draw_result_cache_stats
+from trip_database import query_trips, query_start_date_bounds, query_distinct_values, query_cost_ledger_per_month, query_fuel_costs
+from time_index import build_time_index, get_date_range_bounds, get_sorted_range_positions
+from trip_partitions import PARTITION_MANIFEST, get_partition_date_bounds, list_partition_registrations, read_trip_partitions
+from trip_query import TripQuery
+from hubs import calculate_hub_scores, draw_hubs
+from heavy_hitters import FLEET_SKETCH_KEY, build_destination_sketches, load_destination_sketches, draw_top_destinations
+from leaderboard import LEADERBOARD_SORT_COLUMNS, calculate_fleet_leaderboard, draw_fleet_leaderboard
+from detour import add_detour_columns, draw_detours
+from what_if import build_location_trip_index, compare_geofence_scenarios, draw_geofence_scenarios
+from paginated_table import draw_paginated_table, get_month_sort_key
+from timeline import draw_vehicle_timeline
+from forecasting import FORECAST_METRICS, calculate_fleet_forecasts, calculate_forecast_totals, draw_forecast_chart
+from validation import validate_trips, draw_validation_report
+from gazetteer import load_gazetteer, geocode_locations, calculate_nearest_geofences, add_distance_to_geofence_column, get_geographic_positions
+from recurring_routes import find_recurring_routes, draw_recurring_routes
+from computation_graph import define_node, define_switch, evaluate_node, draw_node_timings
 
 st.set_option('deprecation.showPyplotGlobalUse', False)
 
@@ -16,12 +37,10 @@ def calculate_total_fuel_cost(distance):
 
 
 # Function to calculate the total fuel cost per month
-# Function to calculate the total fuel cost per month
-def calculate_total_fuel_cost_per_month(df):
-    df['Total Cost on Fuel (TZS)'] = df['Distance'].apply(calculate_total_fuel_cost)
-    df['Total Cost on Fuel (TZS)'] = df['Total Cost on Fuel (TZS)'].round().astype(int)  # Round off to nearest whole number
-    total_fuel_cost_per_month = df.groupby(df['Start Month'])['Total Cost on Fuel (TZS)'].sum().reset_index(name='Total Fuel Cost')
-    return total_fuel_cost_per_month
+@cached_result
+def calculate_total_fuel_cost_per_month(df, cost_rates=None):
+    total_monthly_data = calculate_cost_ledger(df, 'Month', cost_rates)
+    return total_monthly_data[['Start Month', 'Total Trips', 'Total Distance Covered (km)', 'Total Fuel Cost (TZS)']]
 # Function to calculate the total cost on fuel
 def calculate_total_fuel_cost(distance):
     # Check if distance is NaN
@@ -37,9 +56,10 @@ def calculate_total_fuel_cost(distance):
 
 
 # Function to calculate fuel costs and percentages for the selected month
+@cached_result
 def calculate_fuel_costs(df):
-    on_route_df = df[~df['Start Geofence'].isnull() & ~df['End Geofence'].isnull()]
-    out_of_route_df = df[df['Start Geofence'].isnull() & df['End Geofence'].isnull()]
+    on_route_df = TripQuery(df).geofence_status('Within Geofence').collect()
+    out_of_route_df = TripQuery(df).geofence_status('Out of Geofence').collect()
 
     on_route_fuel_cost = on_route_df['Distance'].apply(calculate_total_fuel_cost).sum()
     out_of_route_fuel_cost = out_of_route_df['Distance'].apply(calculate_total_fuel_cost).sum()
@@ -52,6 +72,12 @@ def calculate_fuel_costs(df):
 
     return on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route
 
+# Function to calculate fuel costs for the selected trips, inside the trip database when there is one
+def calculate_selected_fuel_costs(filtered_df, selected_registration, trip_database=None, date_range=None):
+    if trip_database is not None:
+        return query_fuel_costs(trip_database, registration=selected_registration, date_range=date_range)
+    return calculate_fuel_costs(filtered_df)
+
 def plot_null_values(data, column):
     # Create a bar plot to visualize null values with a colored background
     plt.figure(figsize=(8, 5))
@@ -82,13 +108,58 @@ def plot_null_values(data, column):
         
 
 
-def draw_network_graph(df, selected_registration, selected_start_location, show_trips_per_day):
-    # Filter the dataframe based on the selected registration number and start location
-    filtered_df = df[(df['Registration'] == selected_registration) & (df['Start Location'] == selected_start_location)]
+# Function to calculate the tables shown for a selected registration number and start location
+@cached_result
+def calculate_selection_tables(df, selected_registration, selected_start_location, out_of_route=False, trip_database=None, date_range=None):
+    if trip_database is not None:
+        # Filter and aggregate inside the trip database using its indexes
+        geofence_status = 'Out of Geofence' if out_of_route else None
+        filtered_df = query_trips(trip_database, selected_registration, selected_start_location, geofence_status, date_range)
+        total_fuel_cost_per_month = query_cost_ledger_per_month(trip_database, selected_registration, selected_start_location, geofence_status, date_range)
+        total_fuel_cost_per_month = total_fuel_cost_per_month[['Start Month', 'Total Trips', 'Total Distance Covered (km)', 'Total Fuel Cost (TZS)']]
+    else:
+        # df is the registration number's trips in the date range, from the time index or its partition files
+        selection_query = TripQuery(df).registration(selected_registration).start_location(selected_start_location)
+        # Out of route trips have both Start and End Geofence null
+        if out_of_route:
+            selection_query = selection_query.geofence_status('Out of Geofence')
+        filtered_df = selection_query.collect()
+        # Calculate total trips, distance and fuel cost per month for all selected trips
+        total_fuel_cost_per_month = selection_query.aggregate(calculate_total_fuel_cost_per_month)
 
     # Limit to only 5 trips for network diagram
     filtered_df_network = filtered_df.head(5)
 
+    # Table showing start month, start location, end time, end location, distance, and total cost on fuel of the plotted trips
+    network_table = filtered_df_network[['Start Month', 'End Time', 'Start Location', 'End Location', 'Distance']].copy()
+    network_table['Total Cost on Fuel (TZS)'] = network_table['Distance'].apply(calculate_total_fuel_cost)
+
+    # Total number of trips per month for the selected registration number and start location
+    trips_column = 'Total Trips Out of Route' if out_of_route else 'Total Trips'
+    # Grouped by calendar month, so trips from the same month of different years are not counted together
+    months = filtered_df['Start Time'].dt.to_period('M').rename('Month')
+    total_trips_per_month = filtered_df.groupby([months, 'Registration']).size().reset_index(name=trips_column)
+    total_trips_per_month['Month'] = total_trips_per_month['Month'].dt.strftime('%B %Y')
+
+    return filtered_df, filtered_df_network, network_table, total_trips_per_month, total_fuel_cost_per_month
+
+
+# Columns of the selected trips table that can be sorted on
+TRIPS_TABLE_SORT_COLUMNS = ['Start Time', 'End Location', 'Distance', 'Total Cost on Fuel (TZS)']
+
+
+# Function to get the table of selected trips with their fuel cost, costed in one vectorized pass
+def get_trips_table(filtered_df):
+    trips_table = filtered_df[['Start Time', 'End Time', 'Start Location', 'End Location', 'Distance']].copy()
+    trips_table['Total Cost on Fuel (TZS)'] = calculate_fuel_cost_series(trips_table['Distance']).round()
+    # Only there when a gazetteer is available
+    if 'End Distance to Geofence (km)' in filtered_df:
+        trips_table['End Distance to Geofence (km)'] = filtered_df['End Distance to Geofence (km)']
+    return trips_table
+
+
+# Function to build the network diagram of the plotted trips, node_color tells within and out of route diagrams apart
+def build_network_figure(filtered_df_network, node_color, location_coordinates=None):
     # Create a directed graph
     G = nx.DiGraph()
 
@@ -100,115 +171,67 @@ def draw_network_graph(df, selected_registration, selected_start_location, show_
 
     # Draw the network graph
     fig, ax = plt.subplots()
-    pos = nx.spring_layout(G, seed=42)  # Seed for reproducibility
+    # Places in the gazetteer are drawn at their coordinates, the rest by spring layout (seed for reproducibility)
+    pos = get_geographic_positions(G, location_coordinates)
     labels = nx.get_edge_attributes(G, 'weight')
-    nx.draw_networkx_nodes(G, pos, node_size=700, node_color='skyblue')
+    nx.draw_networkx_nodes(G, pos, node_size=700, node_color=node_color)
     nx.draw_networkx_edges(G, pos, edge_color='gray', arrowsize=20)
     nx.draw_networkx_edge_labels(G, pos, edge_labels=labels)
     nx.draw_networkx_labels(G, pos, font_color='black')
+    return fig
+
+
+def draw_network_graph(selection_tables, network_figure, selected_registration, selected_start_location, show_trips_per_day):
+    # Tables for the selected registration number and start location
+    filtered_df, filtered_df_network, additional_info_table, total_trips_per_month, total_fuel_cost_per_month = selection_tables
 
     # Display the plot using Streamlit
-    st.pyplot(fig)
+    st.pyplot(network_figure)
 
     # Additional information in a table below the graph
     st.subheader(f"Registration Number: {selected_registration}")
     st.subheader(f"Start Location: {selected_start_location}")
 
-    # Table showing start month, start location, end time, end location, distance, and total cost on fuel of trips plotted on the network diagram
     st.write("Trips Plotted on Network Diagram:")
-    additional_info_table = filtered_df_network[['Start Month', 'End Time', 'Start Location', 'End Location', 'Distance']]
-    additional_info_table['Total Cost on Fuel (TZS)'] = additional_info_table['Distance'].apply(calculate_total_fuel_cost)
     st.table(additional_info_table)
 
-    # Total number of trips made per month for the selected registration number and start location
-    total_trips_per_month = filtered_df.groupby(['Start Month', 'Registration']).size().reset_index(name='Total Trips')
-    total_trips_per_month = total_trips_per_month.rename(columns={'Start Month': 'Month'})
-
-    # Add a 'Totals' row
-    totals_row = pd.DataFrame({
-        'Month': ['Totals'],
-        'Registration': [''],
-        'Total Trips': [total_trips_per_month['Total Trips'].sum()]
-    })
-
-    total_trips_per_month = pd.concat([total_trips_per_month, totals_row], ignore_index=True)
-
-    # Calculate total fuel cost per month
-    total_fuel_cost_per_month = calculate_total_fuel_cost_per_month(filtered_df_network)
-    # Add total distance covered for the selected registration number to the table
-    total_fuel_cost_per_month['Total Distance Covered (km)'] = filtered_df['Distance'].sum()
-
-    st.write("Total Fuel Cost per Month (Network Diagram):")
+    st.write("Total Fuel Cost per Month:")
     st.table(total_fuel_cost_per_month)
 
     st.write("Total Number of Trips per Month:")
-    st.table(total_trips_per_month.head(30))  # Limiting to 30 trips
+    draw_paginated_table(total_trips_per_month, 'trips_per_month', sort_columns=['Month', 'Total Trips'], total_columns=['Total Trips'], sort_keys={'Month': get_month_sort_key})
+
+    # Every selected trip, browsable one page at a time
+    st.write("All Selected Trips:")
+    draw_paginated_table(get_trips_table(filtered_df), 'selected_trips', sort_columns=TRIPS_TABLE_SORT_COLUMNS, total_columns=['Distance', 'Total Cost on Fuel (TZS)'])
 
     # Line chart showing trips made per day for the selected registration number if checkbox is selected
     if show_trips_per_day:
         draw_trips_per_day_chart(filtered_df)
 
-def draw_out_of_route_network_graph(df, selected_registration, selected_start_location, show_trips_per_day_out_of_route):
-    # Filter the dataframe for trips where both Start and End Geofence are null (Out of Route)
-    out_of_route_df = df[(df['Start Geofence'].isnull()) & (df['End Geofence'].isnull()) & (df['Registration'] == selected_registration) & (df['Start Location'] == selected_start_location)]
-
-    # Limit to only 5 trips for out of route network diagram
-    out_of_route_df_network = out_of_route_df.head(5)
-
-    # Create a directed graph for out of route network diagram
-    G = nx.DiGraph()
-
-    # Add nodes and edges for out of route network diagram
-    for index, row in out_of_route_df_network.iterrows():
-        G.add_node(row['Start Location'])
-        G.add_node(row['End Location'])
-        G.add_edge(row['Start Location'], row['End Location'], weight=row['Distance'])
-
-    # Draw the out of route network graph
-    fig, ax = plt.subplots()
-    pos = nx.spring_layout(G, seed=42)  # Seed for reproducibility
-    labels = nx.get_edge_attributes(G, 'weight')
-    nx.draw_networkx_nodes(G, pos, node_size=700, node_color='orange')  # Use orange for out of route trips
-    nx.draw_networkx_edges(G, pos, edge_color='gray', arrowsize=20)
-    nx.draw_networkx_edge_labels(G, pos, edge_labels=labels)
-    nx.draw_networkx_labels(G, pos, font_color='black')
+def draw_out_of_route_network_graph(selection_tables, network_figure, selected_registration, selected_start_location, show_trips_per_day_out_of_route):
+    # Tables for trips where both Start and End Geofence are null (Out of Route)
+    out_of_route_df, out_of_route_df_network, out_of_route_table, total_out_of_route_per_month, total_fuel_cost_out_of_route_per_month = selection_tables
 
     # Display the plot using Streamlit
-    st.pyplot(fig)
+    st.pyplot(network_figure)
 
     # Additional information in a table below the graph for out of route trips
     st.subheader(f"Registration Number: {selected_registration}")
     st.subheader(f"Start Location: {selected_start_location}")
 
-    # Table showing start month, start location, end time, end location, distance, and total cost on fuel of out of route trips
     st.write("Trips Out of Route:")
-    out_of_route_table = out_of_route_df_network[['Start Month', 'End Time', 'Start Location', 'End Location', 'Distance']]
-    out_of_route_table['Total Cost on Fuel (TZS)'] = out_of_route_table['Distance'].apply(calculate_total_fuel_cost)
     st.table(out_of_route_table)
 
-    # Total number of trips per month that were out of route for the selected registration number and start location
-    total_out_of_route_per_month = out_of_route_df.groupby(['Start Month', 'Registration']).size().reset_index(name='Total Trips Out of Route')
-    total_out_of_route_per_month = total_out_of_route_per_month.rename(columns={'Start Month': 'Month'})
-
-    # Add a 'Totals' row
-    totals_row = pd.DataFrame({
-        'Month': ['Totals'],
-        'Registration': [''],
-        'Total Trips Out of Route': [total_out_of_route_per_month['Total Trips Out of Route'].sum()]
-    })
-
-    total_out_of_route_per_month = pd.concat([total_out_of_route_per_month, totals_row], ignore_index=True)
-
-    # Calculate total fuel cost per month for out of route trips
-    total_fuel_cost_out_of_route_per_month = calculate_total_fuel_cost_per_month(out_of_route_df_network)
-    # Add total distance covered for the selected registration number to the table
-    total_fuel_cost_out_of_route_per_month['Total Distance Covered (km)'] = out_of_route_df['Distance'].sum()
-
     st.write("Total Fuel Cost per Month (Out of Route):")
     st.table(total_fuel_cost_out_of_route_per_month)
 
     st.write("Total Number of Trips Out of Route per Month:")
-    st.table(total_out_of_route_per_month)
+    draw_paginated_table(total_out_of_route_per_month, 'out_of_route_per_month', sort_columns=['Month', 'Total Trips Out of Route'], total_columns=['Total Trips Out of Route'], sort_keys={'Month': get_month_sort_key})
+
+    # Every selected out of route trip, browsable one page at a time
+    st.write("All Out of Route Trips:")
+    draw_paginated_table(get_trips_table(out_of_route_df), 'out_of_route_trips', sort_columns=TRIPS_TABLE_SORT_COLUMNS, total_columns=['Distance', 'Total Cost on Fuel (TZS)'])
 
     # Line chart showing trips made per day for the selected registration number if checkbox is selected
     if show_trips_per_day_out_of_route:
@@ -216,6 +239,28 @@ def draw_out_of_route_network_graph(df, selected_registration, selected_start_lo
 
 
 
+def draw_fuel_comparison_chart(on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route):
+    # Each argument is a (value, margin of error) pair, exact answers have a margin of 0
+    on_route_fuel_cost, on_route_margin = on_route_fuel_cost
+    out_of_route_fuel_cost, out_of_route_margin = out_of_route_fuel_cost
+    percentage_on_route, percentage_on_route_margin = percentage_on_route
+    percentage_out_of_route, percentage_out_of_route_margin = percentage_out_of_route
+
+    # Bar plot for the comparison
+    fig, ax = plt.subplots()
+    ax.bar(['Within Geofence', 'Out of Geofence'], [on_route_fuel_cost, out_of_route_fuel_cost], yerr=[on_route_margin, out_of_route_margin], capsize=8, color=['skyblue', 'orange'])
+    ax.set_ylabel('Total Fuel Cost (TZS)')
+    ax.set_title('Out of Goefence Fuel Consumption vs Within Geofence Fuel Consumption')
+
+    # Annotate percentages on the bars, with their margin of error when estimated
+    on_route_label = f'{percentage_on_route:.2f}%' + (f' ± {percentage_on_route_margin:.2f}' if percentage_on_route_margin else '')
+    out_of_route_label = f'{percentage_out_of_route:.2f}%' + (f' ± {percentage_out_of_route_margin:.2f}' if percentage_out_of_route_margin else '')
+    ax.text(0, on_route_fuel_cost, on_route_label, ha='center', va='bottom', color='black', fontweight='bold')
+    ax.text(1, out_of_route_fuel_cost, out_of_route_label, ha='center', va='bottom', color='black', fontweight='bold')
+
+    st.pyplot(fig)
+
+
 def draw_trips_per_day_chart(df):
     # Line chart showing trips made per day
     trips_per_day_chart = df.groupby(df['Start Time'].dt.date).size().reset_index(name='Trips per Day')
@@ -223,13 +268,159 @@ def draw_trips_per_day_chart(df):
     st.subheader("Trips Made per Day:")
     st.line_chart(trips_per_day_chart.set_index('Start Time'))
 logo_path = 'WhatsApp Image 2024-03-22 at 12.26.22 PM.jpeg'
-
-def main():
-    # Load dataset
-    df = pd.read_csv('clean_tripdd.csv')
+dataset_path = 'clean_tripdd.csv'
+# Optional SQLite trip database, built with `python trip_database.py clean_tripdd.csv clean_tripdd.sqlite`
+trip_database_path = 'clean_tripdd.sqlite'
+# Optional trip files partitioned by month and registration number, written with `python trip_partitions.py clean_tripdd.csv clean_tripdd_partitions`
+trip_partitions_path = 'clean_tripdd_partitions'
+# Optional gazetteer CSV with Name, Latitude and Longitude columns for wards and districts
+gazetteer_path = 'gazetteer.csv'
+# Views that only read the selected registration number's trips, from the trip store when there is one
+VEHICLE_VIEWS = ["Trips Within the Geofence Analysis", "Trips Out of Geofence Analysis", "Vehicle Trip History"]
+# Destination sketches written next to the dataset by `python cleaning.py raw_trips.csv clean_tripdd.csv`
+destination_sketches_path = os.path.splitext(dataset_path)[0] + '_destinations.json'
+
+# Function to load the trips, dataset_version ties the result to the version of the file it was read from
+def load_trips(dataset_version):
+    df = pd.read_csv(dataset_path)
     df['Start Time'] = pd.to_datetime(df['Start Time'])
     df['End Time'] = pd.to_datetime(df['End Time'])
     df['Start Month'] = df['Start Time'].dt.month_name()
+    return df
+
+
+# Function to load the optional gazetteer, None when there is none
+def load_optional_gazetteer(dataset_version):
+    if not os.path.exists(gazetteer_path):
+        return None
+    return load_gazetteer(gazetteer_path)
+
+
+# Function to get the coordinates and nearest geofence of every unique location, None when there is no gazetteer
+def load_location_coordinates(validation, gazetteer):
+    if gazetteer is None:
+        return None
+    valid_df, _, _ = validation
+    return calculate_nearest_geofences(valid_df, gazetteer)
+
+
+# Function to add the per-trip columns every view shares to the valid trips
+def prepare_trips(validation, location_coordinates):
+    df, _, _ = validation
+    if location_coordinates is not None:
+        df = add_distance_to_geofence_column(df, location_coordinates)
+    # Excess distance and fuel cost of every trip against the best observed distance for its origin and destination
+    return add_detour_columns(df)
+
+
+def get_trip_sample(time_index):
+    return build_stratified_sample(time_index['df'])
+
+
+# Function to get the sample trips of one registration number, or of the whole fleet for None
+def get_registration_sample(sample_df, selected_registration):
+    if selected_registration is None:
+        return sample_df
+    return TripQuery(sample_df).registration(selected_registration).collect()
+
+
+def get_fleet_forecasts(time_index):
+    return calculate_fleet_forecasts(time_index['df'])
+
+
+def get_fleet_anomaly_scores(time_index):
+    return calculate_anomaly_scores(time_index['df'])
+
+
+# Function to get the suspicious trips that started in the date range, with the number of trips scored in it
+def get_date_range_suspicious_trips(scored_df, date_range):
+    # Scored trips are in Start Time order, so the date range is one run of positions
+    range_start_position, range_end_position = get_sorted_range_positions(scored_df, *date_range)
+    date_range_scored_df = scored_df.iloc[range_start_position:range_end_position]
+    return build_suspicious_trips(date_range_scored_df), len(date_range_scored_df)
+
+
+def get_date_range_trips(time_index, date_range):
+    return TripQuery(time_index).date_range(*date_range).collect()
+
+
+def get_registration_trips(time_index, date_range, selected_registration):
+    return TripQuery(time_index).date_range(*date_range).registration(selected_registration).collect()
+
+
+# Function to read a registration number's trips in the date range from the trip store, without loading the fleet's trips
+def get_stored_registration_trips(trip_database, trip_partitions, date_range, selected_registration):
+    if trip_database is not None:
+        return query_trips(trip_database, selected_registration, date_range=date_range)
+    return read_trip_partitions(trip_partitions, selected_registration, date_range=date_range)
+
+
+# Function to get the selection tables, the trip database filters on its own so the frame is not passed (or hashed for the cache key)
+def get_selection_tables(registration_df, selected_registration, selected_start_location, out_of_route, trip_database, date_range):
+    if trip_database is not None:
+        registration_df = None
+    return calculate_selection_tables(registration_df, selected_registration, selected_start_location, out_of_route, trip_database, date_range)
+
+
+def get_selection_network_figure(selection_tables, gazetteer, out_of_route):
+    _, filtered_df_network, _, _, _ = selection_tables
+    # Only the plotted places are looked up, so the diagram does not need the fleet's trips
+    location_coordinates = None
+    if gazetteer is not None:
+        location_coordinates = geocode_locations(pd.unique(filtered_df_network[['Start Location', 'End Location']].values.ravel()), gazetteer)
+    # Use orange for out of route trips
+    return build_network_figure(filtered_df_network, 'orange' if out_of_route else 'skyblue', location_coordinates)
+
+
+# Computation graph of the dashboard, from the dataset to the filtered slices, tables and figures.
+# A node is recomputed only when a node it reads from or one of its parameters changes, so a widget only reruns what is downstream of it
+define_node('trips', load_trips, parameters=['dataset_version'])
+# Rows failing the data quality checks are quarantined before any cost is calculated
+define_node('validation', validate_trips, inputs=['trips'])
+define_node('gazetteer', load_optional_gazetteer, parameters=['dataset_version'])
+define_node('location coordinates', load_location_coordinates, inputs=['validation', 'gazetteer'])
+define_node('prepared trips', prepare_trips, inputs=['validation', 'location coordinates'])
+# Trips sorted by Start Time with a binary-search index per registration number
+define_node('time index', build_time_index, inputs=['prepared trips'])
+# Stratified sample kept alongside the full data for approximate answers, in Start Time order
+define_node('sample', get_trip_sample, inputs=['time index'])
+define_node('registration sample', get_registration_sample, inputs=['sample'], parameters=['registration'])
+# Daily forecasts for every registration number, fitted in one batch on the full history
+define_node('forecasts', get_fleet_forecasts, inputs=['time index'])
+# Every trip is scored against its route's baseline over the full history, so a trip's score does not depend on the date range
+define_node('anomaly scores', get_fleet_anomaly_scores, inputs=['time index'])
+define_node('suspicious trips', get_date_range_suspicious_trips, inputs=['anomaly scores'], parameters=['date_range'])
+# Date range applied to every view, sliced from the time index instead of masking the frame
+define_node('date range trips', get_date_range_trips, inputs=['time index'], parameters=['date_range'])
+define_node('registration trips', get_registration_trips, inputs=['time index'], parameters=['date_range', 'registration'])
+define_node('stored registration trips', get_stored_registration_trips, parameters=['trip_database', 'trip_partitions', 'date_range', 'registration'])
+# The per-vehicle views read the selected registration number's trips from the trip store when there is one
+define_switch('vehicle trips', 'trip_store', {None: 'registration trips', 'database': 'stored registration trips', 'partitions': 'stored registration trips'})
+define_node('selection tables', get_selection_tables, inputs=['vehicle trips'], parameters=['registration', 'start_location', 'out_of_route', 'trip_database', 'date_range'])
+# Toggling a checkbox below the diagram redraws it without rebuilding its layout
+define_node('network figure', get_selection_network_figure, inputs=['selection tables', 'gazetteer'], parameters=['out_of_route'])
+
+
+def main():
+    # Load dataset, cached results are tied to the version of the file they were computed from
+    dataset_version = get_dataset_version(dataset_path)
+    # Filters and aggregations are pushed down into the trip database when it has been built
+    trip_database = trip_database_path if os.path.exists(trip_database_path) else None
+    if trip_database is not None:
+        dataset_version += '|' + get_dataset_version(trip_database)
+    # Otherwise per-vehicle views read just the partitions they need
+    trip_partitions = trip_partitions_path if trip_database is None and os.path.exists(os.path.join(trip_partitions_path, PARTITION_MANIFEST)) else None
+    if trip_partitions is not None:
+        dataset_version += '|' + get_dataset_version(os.path.join(trip_partitions, PARTITION_MANIFEST))
+    if os.path.exists(gazetteer_path):
+        dataset_version += '|' + get_dataset_version(gazetteer_path)
+    if os.path.exists(destination_sketches_path):
+        dataset_version += '|' + get_dataset_version(destination_sketches_path)
+    set_dataset_version(dataset_version)
+    # Widget values and settings the computation graph's nodes are evaluated with
+    trip_store = 'database' if trip_database is not None else 'partitions' if trip_partitions is not None else None
+    graph_parameters = {'dataset_version': dataset_version, 'trip_database': trip_database, 'trip_partitions': trip_partitions, 'trip_store': trip_store}
+
 
     # Streamlit app title
     
@@ -278,7 +469,34 @@ Moving forward, version 2 will evolve into a predictive tool that will optimize
         else:
            # Visualization options
             st.sidebar.title("Visualization Options")
-            selected_option = st.sidebar.radio("Select Option", ["Trips Out of Geofence Fuel Consumption vs Trips Within Geofence Fuel Consumption", "Trips that Started Out of Geofence", "Trips that Ended Out of Geofence", "Trips Within the Geofence Analysis", "Trips Out of Geofence Analysis"])
+            selected_option = st.sidebar.radio("Select Option", ["Trips Out of Geofence Fuel Consumption vs Trips Within Geofence Fuel Consumption", "Trips that Started Out of Geofence", "Trips that Ended Out of Geofence", "Trips Within the Geofence Analysis", "Trips Out of Geofence Analysis", "Vehicle Trip History", "Suspicious Trips Analysis", "Cost Ledger", "Hubs", "Top Out of Geofence Destinations", "Fleet Leaderboard", "Detour Analysis", "Geofence What-If", "Vehicle Timeline", "Forecasts", "Data Quality", "Recurring Routes"])
+
+            # Nodes are evaluated where a view needs them, so the About page computes nothing and the sample and forecasts
+            # are only computed when a view showing them is opened. With a trip store the dates and registration numbers
+            # come from the store, so the per-vehicle views never load the fleet's trips
+            if trip_store == 'database':
+                # Read from the trip database's indexes
+                first_date, last_date = query_start_date_bounds(trip_database)
+                registration_numbers = query_distinct_values(trip_database, 'Registration')
+            elif trip_store == 'partitions':
+                first_date, last_date = get_partition_date_bounds(trip_partitions)
+                registration_numbers = list_partition_registrations(trip_partitions)
+            else:
+                time_index = evaluate_node('time index', graph_parameters)
+                first_date = time_index['start_times'][0].date()
+                last_date = time_index['start_times'][-1].date()
+                registration_numbers = list(time_index['registrations'])
+
+            # Date range applied to every view, sliced from the time index instead of masking the frame
+            selected_dates = st.sidebar.date_input("Date Range", value=(first_date, last_date), min_value=first_date, max_value=last_date)
+            # While the range is being picked only the start date is set
+            if not isinstance(selected_dates, (list, tuple)):
+                selected_dates = (selected_dates,)
+            graph_parameters['date_range'] = (selected_dates[0], selected_dates[-1])
+            date_range = graph_parameters['date_range']
+            # Fleet-wide views work on every trip in the date range, the per-vehicle views only on the selected vehicle's
+            if selected_option not in VEHICLE_VIEWS:
+                df = evaluate_node('date range trips', graph_parameters)
 
             if selected_option == "Trips that Started Out of Geofence":
                 plot_null_values(df, 'Start Geofence')
@@ -292,33 +510,57 @@ Moving forward, version 2 will evolve into a predictive tool that will optimize
 
             elif selected_option == "Trips Within the Geofence Analysis":
                 # Dropdowns to select a specific registration number and start location
-                registration_options = df['Registration'].unique()
+                registration_options = registration_numbers
                 selected_registration = st.selectbox("Select Registration Number", registration_options)
 
-                start_location_options = df['Start Location'].unique()
+                # Start locations of the selected registration number's trips in the date range
+                graph_parameters['registration'] = selected_registration
+                start_location_options = evaluate_node('vehicle trips', graph_parameters)['Start Location'].dropna().unique()
                 selected_start_location = st.selectbox("Select Start Location", start_location_options)
 
                 # Checkbox for visualizing number of trips per day on the selected registration number
                 show_trips_per_day = st.checkbox("Show Trips Per Day")
 
-                # Draw the network graph for the selected registration number and start location
-                draw_network_graph(df, selected_registration, selected_start_location, show_trips_per_day)
+                # Draw the network graph for the selected registration number and start location, from that registration number's date range slice
+                graph_parameters.update({'registration': selected_registration, 'start_location': selected_start_location, 'out_of_route': False})
+                draw_network_graph(evaluate_node('selection tables', graph_parameters), evaluate_node('network figure', graph_parameters), selected_registration, selected_start_location, show_trips_per_day)
+                # Forecast trips for the registration number next to its trips per day
+                if show_trips_per_day:
+                    draw_forecast_chart(evaluate_node('forecasts', graph_parameters), selected_registration)
                 st.markdown("<br>", unsafe_allow_html=True)
                 st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
 
             elif selected_option == "Trips Out of Geofence Analysis":
                 # Dropdowns to select a specific registration number and start location for out of route network diagram
-                registration_options = df['Registration'].unique()
+                registration_options = registration_numbers
                 selected_registration_out_of_route = st.selectbox("Select Registration Number", registration_options)
 
-                start_location_options = df['Start Location'].unique()
+                # Start locations of the selected registration number's trips in the date range
+                graph_parameters['registration'] = selected_registration_out_of_route
+                start_location_options = evaluate_node('vehicle trips', graph_parameters)['Start Location'].dropna().unique()
                 selected_start_location_out_of_route = st.selectbox("Select Start Location", start_location_options)
 
                 # Checkbox for visualizing number of trips per day on the selected registration number for out of route network diagram
                 show_trips_per_day_out_of_route = st.checkbox("Show Trips Per Day")
 
-                # Draw the out of route network graph for the selected registration number and start location
-                draw_out_of_route_network_graph(df, selected_registration_out_of_route, selected_start_location_out_of_route, show_trips_per_day_out_of_route)
+                # Draw the out of route network graph for the selected registration number and start location, from that registration number's date range slice
+                graph_parameters.update({'registration': selected_registration_out_of_route, 'start_location': selected_start_location_out_of_route, 'out_of_route': True})
+                draw_out_of_route_network_graph(evaluate_node('selection tables', graph_parameters), evaluate_node('network figure', graph_parameters), selected_registration_out_of_route, selected_start_location_out_of_route, show_trips_per_day_out_of_route)
+                # Forecast trips for the registration number next to its trips per day
+                if show_trips_per_day_out_of_route:
+                    draw_forecast_chart(evaluate_node('forecasts', graph_parameters), selected_registration_out_of_route)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Vehicle Trip History":
+                registration_options = registration_numbers
+                selected_registration_history = st.selectbox("Select Registration Number", registration_options)
+
+                # Every trip of the registration number in the date range, browsable one page at a time
+                graph_parameters['registration'] = selected_registration_history
+                vehicle_df = evaluate_node('vehicle trips', graph_parameters)
+                st.subheader(f"Trip History of {selected_registration_history}:")
+                draw_paginated_table(get_trips_table(vehicle_df), 'vehicle_trip_history', sort_columns=TRIPS_TABLE_SORT_COLUMNS, total_columns=['Distance', 'Total Cost on Fuel (TZS)'])
                 st.markdown("<br>", unsafe_allow_html=True)
                 st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
 
@@ -328,31 +570,202 @@ Moving forward, version 2 will evolve into a predictive tool that will optimize
 
                 # If "Select All Registration Numbers" is chosen, use the entire dataframe
                 if fuel_comparison_option == "Select All Registration Numbers":
+                    selected_registration_fuel_comparison = None
                     filtered_df_fuel_comparison = df
                 else:
-                    registration_options = df['Registration'].unique()
+                    registration_options = registration_numbers
                     selected_registration_fuel_comparison = st.selectbox("Select Registration Number", registration_options)
-                    # Filter the dataframe based on the selected registration number
-                    filtered_df_fuel_comparison = df[df['Registration'] == selected_registration_fuel_comparison]
+                    # Slice the selected registration number's trips in the date range from the time index
+                    graph_parameters['registration'] = selected_registration_fuel_comparison
+                    filtered_df_fuel_comparison = evaluate_node('registration trips', graph_parameters)
+
+                # Checkbox for answering from the stratified sample while the exact answer is computed
+                approximate_mode = st.checkbox("Approximate Mode (answer instantly from a sample)")
+
+                fuel_comparison_placeholder = st.empty()
+                if approximate_mode:
+                    exact_fuel_costs = submit_exact_result(('calculate_fuel_costs', selected_registration_fuel_comparison, date_range, dataset_version), calculate_selected_fuel_costs, filtered_df_fuel_comparison, selected_registration_fuel_comparison, trip_database, date_range)
+                    if not exact_fuel_costs.done():
+                        # Show the estimate with 95% error bars until the exact answer is ready
+                        graph_parameters['registration'] = selected_registration_fuel_comparison
+                        sample_df_fuel_comparison = evaluate_node('registration sample', graph_parameters)
+                        # The sample is in Start Time order, so the date range is one run of positions found by binary search,
+                        # the mask still covers the whole sample so every stratum keeps its size
+                        range_start_position, range_end_position = get_sorted_range_positions(sample_df_fuel_comparison, *date_range)
+                        date_range_mask = pd.Series(False, index=sample_df_fuel_comparison.index)
+                        date_range_mask.iloc[range_start_position:range_end_position] = True
+                        on_route_estimate, out_of_route_estimate, percentage_on_route_estimate, percentage_out_of_route_estimate = estimate_fuel_costs(sample_df_fuel_comparison, date_range_mask)
+                        with fuel_comparison_placeholder.container():
+                            draw_fuel_comparison_chart(on_route_estimate, out_of_route_estimate, percentage_on_route_estimate, percentage_out_of_route_estimate)
+                            st.write(f"Estimated from {int(date_range_mask.sum())} of {len(filtered_df_fuel_comparison)} trips, error bars show the 95% confidence interval. The exact answer will replace it once ready.")
+                    on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route = exact_fuel_costs.result()
+                else:
+                    # Calculate total fuel cost for both on-route and out-of-route trips
+                    on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route = calculate_selected_fuel_costs(filtered_df_fuel_comparison, selected_registration_fuel_comparison, trip_database, date_range)
 
-                # Calculate total fuel cost for both on-route and out-of-route trips
-                on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route = calculate_fuel_costs(filtered_df_fuel_comparison)
+                with fuel_comparison_placeholder.container():
+                    draw_fuel_comparison_chart((on_route_fuel_cost, 0), (out_of_route_fuel_cost, 0), (percentage_on_route, 0), (percentage_out_of_route, 0))
 
-                # Bar plot for the comparison
-                fig, ax = plt.subplots()
-                ax.bar(['Within Geofence', 'Out of Geofence'], [on_route_fuel_cost, out_of_route_fuel_cost], color=['skyblue', 'orange'])
-                ax.set_ylabel('Total Fuel Cost (TZS)')
-                ax.set_title('Out of Goefence Fuel Consumption vs Within Geofence Fuel Consumption')
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
 
-                # Annotate percentages on the bars
-                ax.text(0, on_route_fuel_cost, f'{percentage_on_route:.2f}%', ha='center', va='bottom', color='black', fontweight='bold')
-                ax.text(1, out_of_route_fuel_cost, f'{percentage_out_of_route:.2f}%', ha='center', va='bottom', color='black', fontweight='bold')
+            elif selected_option == "Suspicious Trips Analysis":
+                # Trips are scored against the full fleet history, the date range only picks which scored trips are shown
+                suspicious_df, date_range_trips = evaluate_node('suspicious trips', graph_parameters)
 
-                st.pyplot(fig)
+                registration_options = ["All Registration Numbers"] + registration_numbers
+                selected_registration_suspicious = st.selectbox("Select Registration Number", registration_options)
+                if selected_registration_suspicious == "All Registration Numbers":
+                    selected_registration_suspicious = None
 
+                top_n = st.slider("Number of trips to show", 5, 100, 20)
+
+                draw_suspicious_trips(suspicious_df, date_range_trips, selected_registration_suspicious, top_n)
                 st.markdown("<br>", unsafe_allow_html=True)
                 st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
 
+            elif selected_option == "Cost Ledger":
+                # Grains to group the ledger by, e.g. month and registration number
+                selected_grains = st.multiselect("Group Costs By", list(LEDGER_GRAINS), default=["Month"])
+
+                # Cost rates can be adjusted from the sidebar
+                st.sidebar.title("Cost Rates")
+                cost_rates = {
+                    'fuel_cost_per_litre': st.sidebar.number_input("Fuel Cost per Litre (TZS)", min_value=0, value=DEFAULT_COST_RATES['fuel_cost_per_litre']),
+                    'fuel_consumption_per_km': 1 / st.sidebar.number_input("Kilometres per Litre", min_value=1, value=9),
+                    'per_diem_per_trip': st.sidebar.number_input("Per Diem per Trip (TZS)", min_value=0, value=DEFAULT_COST_RATES['per_diem_per_trip']),
+                    'maintenance_cost_per_km': st.sidebar.number_input("Maintenance Cost per km (TZS)", min_value=0, value=DEFAULT_COST_RATES['maintenance_cost_per_km']),
+                }
+
+                draw_cost_ledger(df, selected_grains, cost_rates)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Hubs":
+                # Centrality, hub scores and communities over the full location graph, cached per dataset version and date range
+                hub_df = calculate_hub_scores(df)
+
+                top_n_hubs = st.slider("Number of hubs to show", 5, 50, 15)
+
+                draw_hubs(hub_df, top_n_hubs)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Top Out of Geofence Destinations":
+                # Space-Saving sketches per registration number and fleet-wide, the ones kept during ingest answer for the whole dataset,
+                # other date ranges are built in one pass over the slice and cached per dataset version and date range
+                if os.path.exists(destination_sketches_path) and date_range == (first_date, last_date):
+                    _, quarantine_df, _ = evaluate_node('validation', graph_parameters)
+                    destination_sketches = load_destination_sketches(destination_sketches_path, quarantine_df)
+                else:
+                    destination_sketches = build_destination_sketches(df)
+
+                registration_options = [FLEET_SKETCH_KEY] + registration_numbers
+                selected_registration_destinations = st.selectbox("Select Registration Number", registration_options)
+
+                top_n_destinations = st.slider("Number of destinations to show", 5, 50, 10)
+
+                draw_top_destinations(destination_sketches, selected_registration_destinations, top_n_destinations)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Fleet Leaderboard":
+                # Every registration number is costed in one grouped pass, sorting and filtering reuse the cached table
+                leaderboard = calculate_fleet_leaderboard(df)
+
+                if leaderboard.empty:
+                    st.warning("No trips found in the selected date range.")
+                else:
+                    sort_by = st.selectbox("Sort By", LEADERBOARD_SORT_COLUMNS)
+                    ascending = st.checkbox("Lowest First")
+                    min_trips = st.slider("Minimum Trips", 0, int(leaderboard['Total Trips'].max()), 0)
+
+                    draw_fleet_leaderboard(leaderboard, sort_by, ascending, min_trips)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Detour Analysis":
+                registration_options = ["All Registration Numbers"] + registration_numbers
+                selected_registration_detour = st.selectbox("Select Registration Number", registration_options)
+                if selected_registration_detour == "All Registration Numbers":
+                    detour_df = df
+                else:
+                    graph_parameters['registration'] = selected_registration_detour
+                    detour_df = evaluate_node('registration trips', graph_parameters)
+
+                top_n_detours = st.slider("Number of detours to show", 5, 50, 10)
+
+                draw_detours(detour_df, top_n_detours)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Geofence What-If":
+                # Trips are indexed by location once, each scenario then only flips the trips at its added locations
+                location_trip_index = build_location_trip_index(df)
+
+                scenario_count = st.slider("Number of Scenarios", 1, 3, 1)
+                scenarios = {}
+                for scenario_number in range(1, scenario_count + 1):
+                    added_locations = st.multiselect(f"Locations to add as geofences in Scenario {scenario_number}", location_trip_index['candidates'], key=f"geofence_scenario_{scenario_number}")
+                    scenarios[f"Scenario {scenario_number}"] = added_locations
+
+                draw_geofence_scenarios(compare_geofence_scenarios(location_trip_index, scenarios))
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Vehicle Timeline":
+                # Legs and dwell gaps of each vehicle over the date range, the date range sets the zoom level
+                registration_options = registration_numbers
+                selected_registrations_timeline = st.multiselect("Select Registration Numbers", registration_options, default=registration_options)
+
+                window_start, window_end = get_date_range_bounds(*date_range)
+                draw_vehicle_timeline(df, selected_registrations_timeline, window_start, window_end)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Forecasts":
+                registration_options = ["All Registration Numbers"] + registration_numbers
+                selected_registration_forecast = st.selectbox("Select Registration Number", registration_options)
+                if selected_registration_forecast == "All Registration Numbers":
+                    selected_registration_forecast = None
+
+                forecast_metric = st.selectbox("Select Metric", list(FORECAST_METRICS.values()))
+
+                forecasts = evaluate_node('forecasts', graph_parameters)
+                draw_forecast_chart(forecasts, selected_registration_forecast, forecast_metric)
+                st.subheader("Forecast Totals per Registration Number:")
+                st.table(calculate_forecast_totals(forecasts))
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Data Quality":
+                # Checks run once at load time over the whole dataset, not just the date range
+                loaded_trips = len(evaluate_node('trips', graph_parameters))
+                _, quarantine_df, validation_counts = evaluate_node('validation', graph_parameters)
+                draw_validation_report(loaded_trips, quarantine_df, validation_counts)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+            elif selected_option == "Recurring Routes":
+                # Similar vehicle-days are clustered across the whole fleet with MinHash and LSH, cached per dataset version and date range
+                recurring_routes = find_recurring_routes(df)
+
+                registration_options = ["All Registration Numbers"] + registration_numbers
+                selected_registration_routes = st.selectbox("Select Registration Number", registration_options)
+                if selected_registration_routes == "All Registration Numbers":
+                    selected_registration_routes = None
+
+                draw_recurring_routes(recurring_routes, selected_registration_routes)
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
+    # Hit and miss counters of the shared result cache, for tuning its memory budget
+    if st.sidebar.checkbox("Show Cache Statistics"):
+        draw_result_cache_stats()
+    # Runs, reuses and run times of each node of the computation graph, to see what a widget change recomputed
+    if st.sidebar.checkbox("Show Computation Timings"):
+        draw_node_timings()
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,136 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import pandas as pd
+
+from heavy_hitters import FLEET_SKETCH_KEY, create_sketch, merge_sketches, save_sketches, update_destination_sketches
+
+# Columns of the canonical trip table, in order
+TRIP_COLUMNS = ['Start Time', 'Start Location', 'Start Geofence', 'End Time', 'End Location', 'End Geofence', 'Distance', 'Registration']
+# Column names used by car tracker exports for the canonical columns
+RAW_COLUMN_NAMES = {
+    'Trip Distance': 'Distance',
+    'Distance (km)': 'Distance',
+    'Registration Number': 'Registration',
+}
+# Values the tracker writes when a trip point is not inside any geofence
+NO_GEOFENCE_VALUES = ['', 'Out of Route', '-']
+# Shortest geofence name that is expanded when the tracker truncated it
+MIN_TRUNCATED_GEOFENCE_LENGTH = 10
+
+
+# Function to read a raw car tracker export into the canonical columns
+def read_raw_trips(path):
+    raw_df = pd.read_csv(path, dtype=str)
+    raw_df = raw_df.rename(columns=RAW_COLUMN_NAMES)
+    raw_df = raw_df[TRIP_COLUMNS]
+    # Registration numbers are written as e.g. "T 452 EBA" and "t452eba"
+    raw_df['Registration'] = raw_df['Registration'].str.replace(r'\s+', '', regex=True).str.upper()
+    return raw_df
+
+
+# Function to tidy whitespace and separators in location and geofence names
+def normalize_names(names):
+    names = names.str.strip().str.replace(r'\s+', ' ', regex=True).str.replace(r'\s*,\s*', ', ', regex=True)
+    return names.where(~names.isin(NO_GEOFENCE_VALUES))
+
+
+# Function to map geofence names truncated by the tracker (e.g. "Mikocheni Wareh") to the one full name they start with
+def build_geofence_name_map(raw_df):
+    names = pd.concat([normalize_names(raw_df['Start Geofence']), normalize_names(raw_df['End Geofence'])]).dropna().unique()
+    names = sorted(names)
+    name_map = {}
+    for position, name in enumerate(names):
+        if len(name) < MIN_TRUNCATED_GEOFENCE_LENGTH:
+            continue
+        # Names are sorted, so every longer name starting with this one follows it directly
+        longer_names = []
+        for other_name in names[position + 1:]:
+            if not other_name.startswith(name):
+                break
+            longer_names.append(other_name)
+        if len(longer_names) == 1:
+            name_map[name] = longer_names[0]
+    return name_map
+
+
+# Function to clean the trips of one registration number, run in a worker process
+def clean_registration_trips(registration_df, geofence_name_map, drop_zero_distance=True):
+    clean_df = registration_df.copy()
+    clean_df['Start Time'] = pd.to_datetime(clean_df['Start Time'], errors='coerce')
+    clean_df['End Time'] = pd.to_datetime(clean_df['End Time'], errors='coerce')
+    clean_df['Distance'] = pd.to_numeric(clean_df['Distance'], errors='coerce')
+    for column in ['Start Location', 'End Location']:
+        clean_df[column] = normalize_names(clean_df[column])
+    for column in ['Start Geofence', 'End Geofence']:
+        geofence = normalize_names(clean_df[column])
+        clean_df[column] = geofence.replace(geofence_name_map)
+
+    # Rows that cannot be costed or placed on a route
+    broken_trips = {
+        'Missing Time': clean_df['Start Time'].isnull() | clean_df['End Time'].isnull(),
+        'End Before Start': clean_df['End Time'] < clean_df['Start Time'],
+        'Missing Location': clean_df['Start Location'].isnull() | clean_df['End Location'].isnull(),
+        'Missing Distance': clean_df['Distance'].isnull() | (clean_df['Distance'] < 0),
+    }
+    if drop_zero_distance:
+        broken_trips['Zero Distance'] = clean_df['Distance'] == 0
+
+    dropped_counts = {}
+    keep_mask = pd.Series(True, index=clean_df.index)
+    for reason, reason_mask in broken_trips.items():
+        dropped_counts[reason] = int((reason_mask & keep_mask).sum())
+        keep_mask &= ~reason_mask
+    clean_df = clean_df[keep_mask]
+
+    duplicated_mask = clean_df.duplicated()
+    dropped_counts['Duplicate'] = int(duplicated_mask.sum())
+    clean_df = clean_df[~duplicated_mask]
+
+    clean_df = clean_df.sort_values(['Start Time', 'End Time'], kind='mergesort')
+    # Out of geofence destinations are counted while the partition is in memory, the sketches are merged afterwards
+    destination_sketches = update_destination_sketches({}, clean_df)
+    return clean_df, dropped_counts, destination_sketches
+
+
+# Function to clean a raw export into the canonical trip table, one registration number per task across a process pool
+def clean_trip_export(raw_path, output_path=None, max_workers=None, drop_zero_distance=True):
+    raw_df = read_raw_trips(raw_path)
+    # The name map is built from the whole export first, so every partition is cleaned the same way
+    geofence_name_map = build_geofence_name_map(raw_df)
+
+    missing_registration = raw_df['Registration'].isnull()
+    partitions = [registration_df for _, registration_df in raw_df[~missing_registration].groupby('Registration', sort=True)]
+
+    if max_workers == 1 or len(partitions) <= 1:
+        results = [clean_registration_trips(partition, geofence_name_map, drop_zero_distance) for partition in partitions]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            # map keeps the partition order, so the output does not depend on which worker finishes first
+            results = list(executor.map(clean_registration_trips, partitions, repeat(geofence_name_map), repeat(drop_zero_distance)))
+
+    clean_df = pd.concat([result[0] for result in results], ignore_index=True) if results else raw_df.iloc[:0]
+    cleaning_report = {'Raw Trips': len(raw_df), 'Missing Registration': int(missing_registration.sum())}
+    destination_sketches = {FLEET_SKETCH_KEY: create_sketch()}
+    for _, dropped_counts, partition_sketches in results:
+        for reason, count in dropped_counts.items():
+            cleaning_report[reason] = cleaning_report.get(reason, 0) + count
+        # Each partition holds one registration number, so only the fleet-wide sketch needs merging
+        fleet_sketch = partition_sketches.pop(FLEET_SKETCH_KEY)
+        destination_sketches[FLEET_SKETCH_KEY] = merge_sketches(destination_sketches[FLEET_SKETCH_KEY], fleet_sketch)
+        destination_sketches.update(partition_sketches)
+    cleaning_report['Clean Trips'] = len(clean_df)
+
+    if output_path is not None:
+        clean_df.to_csv(output_path, index=False, date_format='%Y-%m-%d %H:%M:%S')
+        save_sketches(destination_sketches, os.path.splitext(output_path)[0] + '_destinations.json')
+    return clean_df, cleaning_report
+
+
+if __name__ == "__main__":
+    # Usage: python cleaning.py raw_trips.csv clean_tripdd.csv
+    clean_df, cleaning_report = clean_trip_export(sys.argv[1], sys.argv[2], max_workers=os.cpu_count())
+    for reason, count in cleaning_report.items():
+        print(f"{reason}: {count}")
@@ -0,0 +1,88 @@
+import time
+from threading import Lock
+
+import pandas as pd
+import streamlit as st
+
+# Nodes of the dashboard's computation graph: name -> (function, upstream node names, parameter names)
+graph_nodes = {}
+# Switch nodes that forward to one of several nodes by a parameter value: name -> (parameter name, {value: node name})
+graph_switches = {}
+# Runs, reuses and timings per node, shared by all sessions
+node_stats = {}
+node_stats_lock = Lock()
+
+
+# Function to declare a node, its function is called with the upstream node results and then the parameter values, in order
+def define_node(name, function, inputs=(), parameters=()):
+    graph_nodes[name] = (function, tuple(inputs), tuple(parameters))
+
+
+# Function to declare a switch, e.g. to read a vehicle's trips from whichever trip store is available
+def define_switch(name, parameter, cases):
+    graph_switches[name] = (parameter, dict(cases))
+
+
+# Function to get this session's node results, kept across reruns of the script
+def get_session_nodes():
+    if 'computation_graph' not in st.session_state:
+        st.session_state['computation_graph'] = {}
+    return st.session_state['computation_graph']
+
+
+def record_node_run(name, run_seconds=None):
+    with node_stats_lock:
+        stats = node_stats.setdefault(name, {'Runs': 0, 'Reuses': 0, 'Last Run (ms)': 0.0, 'Total Run Time (ms)': 0.0})
+        if run_seconds is None:
+            stats['Reuses'] += 1
+        else:
+            stats['Runs'] += 1
+            stats['Last Run (ms)'] = run_seconds * 1000
+            stats['Total Run Time (ms)'] += run_seconds * 1000
+
+
+# Function to evaluate a node and get its result with its version, the version changes every time the node is recomputed
+def evaluate_versioned_node(name, parameter_values):
+    if name in graph_switches:
+        parameter, cases = graph_switches[name]
+        case_name = cases[parameter_values.get(parameter)]
+        value, version = evaluate_versioned_node(case_name, parameter_values)
+        # The chosen node is part of the version, so changing cases recomputes the nodes downstream
+        return value, (case_name, version)
+
+    function, inputs, parameters = graph_nodes[name]
+    upstream = [evaluate_versioned_node(input_name, parameter_values) for input_name in inputs]
+    arguments = [value for value, _ in upstream] + [parameter_values.get(parameter) for parameter in parameters]
+
+    # A node is only stale when an upstream node was recomputed or one of its own parameters changed
+    key = (tuple(version for _, version in upstream), tuple(parameter_values.get(parameter) for parameter in parameters))
+    session_nodes = get_session_nodes()
+    memo = session_nodes.get(name)
+    if memo is not None and memo['key'] == key:
+        record_node_run(name)
+        return memo['value'], memo['version']
+
+    start = time.perf_counter()
+    value = function(*arguments)
+    record_node_run(name, time.perf_counter() - start)
+    version = memo['version'] + 1 if memo is not None else 0
+    session_nodes[name] = {'key': key, 'value': value, 'version': version}
+    return value, version
+
+
+# Function to get the result of a node, recomputing it and the nodes it depends on only where their inputs changed
+def evaluate_node(name, parameter_values):
+    return evaluate_versioned_node(name, parameter_values)[0]
+
+
+def get_node_timings():
+    with node_stats_lock:
+        timings = pd.DataFrame.from_dict(node_stats, orient='index')
+    if timings.empty:
+        return timings
+    return timings.round(1).sort_values('Total Run Time (ms)', ascending=False).rename_axis('Node')
+
+
+def draw_node_timings():
+    st.sidebar.subheader("Computation Timings:")
+    st.sidebar.table(get_node_timings())
@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ledger import calculate_fuel_cost_series
+from result_cache import cached_result
+
+# Baseline distance of an origin-destination pair, a low percentile so one mis-recorded short trip does not set it
+DETOUR_BASELINE_QUANTILE = 0.1
+# Pairs driven fewer times than this have no reliable baseline and are not scored
+DETOUR_MIN_PAIR_TRIPS = 3
+# Columns added to the trip table
+DETOUR_COLUMNS = ['Baseline Distance', 'Excess Distance', 'Detour Index', 'Excess Fuel Cost (TZS)']
+
+
+# Function to calculate the baseline distance of every origin-destination pair in one grouped pass
+def calculate_pair_baselines(df, quantile=DETOUR_BASELINE_QUANTILE, min_pair_trips=DETOUR_MIN_PAIR_TRIPS):
+    # Zero distances are tracker dropouts, and trips back to the start location have no single shortest route
+    valid = (df['Distance'] > 0) & (df['Start Location'] != df['End Location'])
+    pair_distance = df.loc[valid, 'Distance'].groupby([df.loc[valid, 'Start Location'], df.loc[valid, 'End Location']])
+    baselines = pair_distance.quantile(quantile)
+    return baselines[pair_distance.size() >= min_pair_trips].rename('Baseline Distance')
+
+
+# Function to add the detour columns to the trip table, trips without a baseline have no excess
+@cached_result
+def add_detour_columns(df, cost_rates=None):
+    baselines = calculate_pair_baselines(df)
+    detour_df = df.copy()
+    pair_keys = pd.MultiIndex.from_arrays([df['Start Location'], df['End Location']])
+    detour_df['Baseline Distance'] = baselines.reindex(pair_keys).to_numpy()
+
+    excess_distance = (detour_df['Distance'] - detour_df['Baseline Distance']).clip(lower=0)
+    detour_df['Excess Distance'] = excess_distance.fillna(0)
+    detour_df['Detour Index'] = (detour_df['Distance'] / detour_df['Baseline Distance']).replace(np.inf, np.nan)
+    detour_df['Excess Fuel Cost (TZS)'] = calculate_fuel_cost_series(detour_df['Excess Distance'], cost_rates)
+    return detour_df
+
+
+# Function to roll the avoidable distance and fuel cost up by registration number and month
+def calculate_detour_rollup(detour_df):
+    month = detour_df['Start Time'].dt.to_period('M').rename('Start Month')
+    scored = detour_df['Baseline Distance'].notnull()
+    rollup = pd.DataFrame({
+        'Scored Trips': scored.astype(int),
+        'Detour Trips': (detour_df['Excess Distance'] > 0).astype(int),
+        'Excess Distance (km)': detour_df['Excess Distance'],
+        'Excess Fuel Cost (TZS)': detour_df['Excess Fuel Cost (TZS)'],
+    }).groupby([detour_df['Registration'], month]).sum().reset_index()
+    rollup['Start Month'] = rollup['Start Month'].dt.strftime('%B %Y')
+    return rollup.round({'Excess Distance (km)': 1, 'Excess Fuel Cost (TZS)': 0})
+
+
+def draw_detours(detour_df, top_n):
+    if detour_df.empty:
+        st.warning("No trips found for the selected filters.")
+        return
+
+    # The detour columns are already on every trip, so the selection's avoidable spend is a single sum
+    st.subheader("Avoidable Spend:")
+    st.write(f"Excess Distance: {detour_df['Excess Distance'].sum():,.1f} km")
+    st.write(f"Excess Fuel Cost: {detour_df['Excess Fuel Cost (TZS)'].sum():,.0f} TZS")
+    st.write(f"{int(detour_df['Baseline Distance'].notnull().sum())} of {len(detour_df)} trips have a baseline to compare against.")
+
+    st.subheader("Excess Fuel Cost per Registration Number and Month:")
+    st.table(calculate_detour_rollup(detour_df))
+
+    st.subheader("Largest Detours:")
+    largest_detours = detour_df.nlargest(top_n, 'Excess Distance')
+    st.table(largest_detours[['Start Time', 'Registration', 'Start Location', 'End Location', 'Distance'] + DETOUR_COLUMNS].round({column: 2 for column in DETOUR_COLUMNS}))
@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ledger import calculate_fuel_cost_series
+from result_cache import cached_result
+
+# Days forecast after the last day of data
+FORECAST_DAYS = 14
+# Daily series forecast for every registration number
+FORECAST_METRICS = {
+    'Trips': 'Trips per Day',
+    'Distance': 'Distance per Day (km)',
+    'Fuel Cost': 'Fuel Cost per Day (TZS)',
+}
+
+
+# Function to build the daily trips, distance and fuel cost of every registration number, days without trips are 0
+def build_daily_series(df):
+    trips = df[df['Start Time'].notnull()]
+    daily = pd.DataFrame({
+        'Trips': 1,
+        'Distance': trips['Distance'].fillna(0),
+        'Fuel Cost': calculate_fuel_cost_series(trips['Distance']),
+    }).groupby([trips['Start Time'].dt.normalize().rename('Date'), trips['Registration']]).sum()
+
+    dates = pd.date_range(daily.index.get_level_values('Date').min(), daily.index.get_level_values('Date').max(), freq='D')
+    # One column per (metric, registration number), one row per day
+    return daily.unstack('Registration').reindex(dates, fill_value=0).fillna(0)
+
+
+# Function to build the regression inputs for a run of days: intercept, linear trend and a weekday effect
+def build_design_matrix(dates, first_date):
+    trend = ((dates - first_date) / pd.Timedelta(days=1)).to_numpy()
+    weekday_effects = (dates.dayofweek.to_numpy()[:, None] == np.arange(1, 7)).astype(float)
+    return np.column_stack([np.ones(len(dates)), trend, weekday_effects])
+
+
+# Function to fit every registration number's series at once and forecast the next days, all series share one least squares solve
+@cached_result
+def calculate_fleet_forecasts(df, forecast_days=FORECAST_DAYS):
+    daily = build_daily_series(df)
+    first_date = daily.index[0]
+    coefficients, _, _, _ = np.linalg.lstsq(build_design_matrix(daily.index, first_date), daily.to_numpy(), rcond=None)
+
+    forecast_dates = pd.date_range(daily.index[-1] + pd.Timedelta(days=1), periods=forecast_days, freq='D')
+    # Counts, distances and costs cannot go below 0
+    forecast = pd.DataFrame(np.clip(build_design_matrix(forecast_dates, first_date) @ coefficients, 0, None), index=forecast_dates, columns=daily.columns)
+
+    forecasts = pd.concat([daily.stack('Registration').assign(Forecast=False), forecast.stack('Registration').assign(Forecast=True)])
+    forecasts = forecasts.rename(columns=FORECAST_METRICS).rename_axis(['Date', 'Registration']).reset_index()
+    return forecasts.sort_values(['Registration', 'Date']).reset_index(drop=True)
+
+
+# Function to sum the forecast days of every registration number, for the fleet table
+def calculate_forecast_totals(forecasts):
+    upcoming = forecasts[forecasts['Forecast']]
+    totals = upcoming.groupby('Registration')[list(FORECAST_METRICS.values())].sum()
+    return totals.round({'Trips per Day': 0, 'Distance per Day (km)': 1, 'Fuel Cost per Day (TZS)': 0}).rename(columns={
+        'Trips per Day': 'Forecast Trips',
+        'Distance per Day (km)': 'Forecast Distance (km)',
+        'Fuel Cost per Day (TZS)': 'Forecast Fuel Cost (TZS)',
+    })
+
+
+def draw_forecast_chart(forecasts, registration=None, metric='Trips per Day'):
+    series = forecasts if registration is None else forecasts[forecasts['Registration'] == registration]
+    if series.empty:
+        st.warning("No forecast available for the selected registration number.")
+        return
+
+    # History and forecast as two lines, the fleet line is the sum over registration numbers
+    daily = series.groupby(['Date', 'Forecast'])[metric].sum().unstack('Forecast')
+    daily = daily.rename(columns={False: 'History', True: 'Forecast'})
+    st.subheader(f"{metric} Forecast:")
+    st.line_chart(daily)
@@ -0,0 +1,145 @@
+import math
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from result_cache import cached_result
+
+# Kilometres per degree of latitude, and the latitude the coordinates are projected around (Tanzania)
+KM_PER_DEGREE = 111.32
+PROJECTION_LATITUDE = -6.5
+# Spread in degrees the network layout is scaled to when every known place sits at the same point
+GEOGRAPHIC_LAYOUT_MIN_SPAN = 0.1
+# Margin around the known places, as a share of their spread, that places missing from the gazetteer are kept within
+GEOGRAPHIC_LAYOUT_MARGIN = 0.1
+
+
+# Function to read a gazetteer CSV with Name, Latitude and Longitude columns, names are wards or districts like "Mwembesongo, Morogoro Urban"
+def load_gazetteer(path):
+    gazetteer = pd.read_csv(path)
+    gazetteer['Key'] = gazetteer['Name'].str.strip().str.lower()
+    return gazetteer.drop_duplicates('Key').set_index('Key')[['Latitude', 'Longitude']]
+
+
+# Function to find the coordinates of each location name, from the most to the least specific part of the name
+def geocode_locations(locations, gazetteer):
+    rows = []
+    for location in locations:
+        parts = [part.strip().lower() for part in str(location).split(',')]
+        # "Ward, District, Region, Country": try the ward with its district, then the ward, then the district
+        candidates = [', '.join(parts), ', '.join(parts[:2]), parts[0]] + parts[1:2]
+        match = next((candidate for candidate in candidates if candidate in gazetteer.index), None)
+        if match is not None:
+            match_level = 'District' if len(parts) > 1 and match == parts[1] else 'Ward'
+            rows.append((location, gazetteer.at[match, 'Latitude'], gazetteer.at[match, 'Longitude'], match_level))
+    return pd.DataFrame(rows, columns=['Location', 'Latitude', 'Longitude', 'Match Level']).set_index('Location')
+
+
+# Function to project coordinates to kilometres on a flat plane, accurate enough for distances within a region
+def project_coordinates(latitude, longitude):
+    x = np.asarray(longitude, dtype=float) * KM_PER_DEGREE * math.cos(math.radians(PROJECTION_LATITUDE))
+    y = np.asarray(latitude, dtype=float) * KM_PER_DEGREE
+    return np.column_stack([x, y])
+
+
+# Function to build a 2-d tree over points, each node is (point index, split axis, left subtree, right subtree)
+def build_kd_tree(points, indices=None, depth=0):
+    if indices is None:
+        indices = np.arange(len(points))
+    if len(indices) == 0:
+        return None
+    axis = depth % 2
+    ordered = indices[np.argsort(points[indices, axis], kind='stable')]
+    median = len(ordered) // 2
+    return (ordered[median], axis, build_kd_tree(points, ordered[:median], depth + 1), build_kd_tree(points, ordered[median + 1:], depth + 1))
+
+
+# Function to find the nearest point in the tree, only crossing a split when the other side can be closer
+def query_kd_tree(tree, points, query):
+    best = [None, math.inf]
+
+    def search(node):
+        if node is None:
+            return
+        index, axis, left, right = node
+        distance = math.hypot(*(points[index] - query))
+        if distance < best[1]:
+            best[0], best[1] = index, distance
+        split_difference = query[axis] - points[index, axis]
+        near, far = (left, right) if split_difference < 0 else (right, left)
+        search(near)
+        if abs(split_difference) < best[1]:
+            search(far)
+
+    search(tree)
+    return best[0], best[1]
+
+
+# Function to place each geofence at the mean position of the locations trips were recorded at inside it
+def calculate_geofence_centroids(df, location_coordinates):
+    geofence_locations = pd.concat([
+        df[['Start Geofence', 'Start Location']].set_axis(['Geofence', 'Location'], axis=1),
+        df[['End Geofence', 'End Location']].set_axis(['Geofence', 'Location'], axis=1),
+    ]).dropna().drop_duplicates()
+    geofence_locations = geofence_locations.join(location_coordinates[['Latitude', 'Longitude']], on='Location', how='inner')
+    return geofence_locations.groupby('Geofence')[['Latitude', 'Longitude']].mean()
+
+
+# Function to find the nearest geofence of every unique location once, the cost depends on the number of places, not trips
+@cached_result
+def calculate_nearest_geofences(df, gazetteer):
+    locations = pd.unique(pd.concat([df['Start Location'], df['End Location']]).dropna())
+    location_coordinates = geocode_locations(locations, gazetteer)
+    geofence_centroids = calculate_geofence_centroids(df, location_coordinates)
+    if location_coordinates.empty or geofence_centroids.empty:
+        return location_coordinates.assign(**{'Nearest Geofence': None, 'Distance to Geofence (km)': np.nan})
+
+    geofence_points = project_coordinates(geofence_centroids['Latitude'], geofence_centroids['Longitude'])
+    tree = build_kd_tree(geofence_points)
+    location_points = project_coordinates(location_coordinates['Latitude'], location_coordinates['Longitude'])
+    nearest = [query_kd_tree(tree, geofence_points, point) for point in location_points]
+
+    location_coordinates['Nearest Geofence'] = geofence_centroids.index[[index for index, _ in nearest]]
+    location_coordinates['Distance to Geofence (km)'] = [round(distance, 2) for _, distance in nearest]
+    return location_coordinates
+
+
+# Function to add how far from the nearest geofence each trip ended, trips at unknown places get NaN
+def add_distance_to_geofence_column(df, nearest_geofences):
+    located_df = df.copy()
+    located_df['End Distance to Geofence (km)'] = df['End Location'].map(nearest_geofences['Distance to Geofence (km)'])
+    return located_df
+
+
+# Function to lay out a location graph by longitude and latitude, places missing from the gazetteer are placed by spring layout around them
+def get_geographic_positions(G, location_coordinates, seed=42):
+    if location_coordinates is None:
+        return nx.spring_layout(G, seed=seed)
+    known_positions = {node: (location_coordinates.at[node, 'Longitude'], location_coordinates.at[node, 'Latitude']) for node in G if node in location_coordinates.index}
+    if not known_positions:
+        return nx.spring_layout(G, seed=seed)
+    if len(known_positions) == len(G):
+        return known_positions
+
+    # The spring layout works at unit scale, so it runs on the known places moved into a unit box around their centre,
+    # with the unknown places starting next to that centre, and is then scaled back to degrees
+    known_points = np.array(list(known_positions.values()), dtype=float)
+    center = known_points.mean(axis=0)
+    span = max(np.ptp(known_points, axis=0).max(), GEOGRAPHIC_LAYOUT_MIN_SPAN)
+    rng = np.random.default_rng(seed)
+    initial_positions = {node: (np.asarray(known_positions[node]) - center) / span if node in known_positions else rng.uniform(-0.1, 0.1, size=2) for node in G}
+    unit_positions = nx.spring_layout(G, pos=initial_positions, fixed=list(known_positions), seed=seed)
+
+    # Unknown places pushed out by the layout are drawn back in towards the centre, keeping their arrangement,
+    # so they stay within a margin of the known places and the map is not squashed to fit them
+    unknown_nodes = [node for node in G if node not in known_positions]
+    unknown_points = np.array([unit_positions[node] for node in unknown_nodes])
+    limit = np.abs((known_points - center) / span).max(axis=0) + GEOGRAPHIC_LAYOUT_MARGIN
+    overshoot = (np.abs(unknown_points) / limit).max()
+    if overshoot > 1:
+        unknown_points = unknown_points / overshoot
+
+    positions = dict(known_positions)
+    positions.update({node: tuple(center + point * span) for node, point in zip(unknown_nodes, unknown_points)})
+    return positions
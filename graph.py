@@ -3,6 +3,7 @@ import networkx as nx
 import matplotlib.pyplot as plt
 import seaborn as sns
 import streamlit as st
+from trip_query import TripQuery
 
 st.set_option('deprecation.showPyplotGlobalUse', False)
 
@@ -19,11 +20,8 @@ def plot_out_of_route(data, geofence_column):
     st.pyplot()
 
 def draw_network_graph(df, selected_start_location):
-    # Filter the dataframe based on the selected start location
-    filtered_df = df[df['Start Location'] == selected_start_location]
-
-    # Limit to only 5 trips
-    filtered_df = filtered_df.head(5)
+    # Filter the dataframe based on the selected start location, limited to only 5 trips
+    filtered_df = TripQuery(df).start_location(selected_start_location).limit(5).collect()
 
     # Create a directed graph
     G = nx.DiGraph()
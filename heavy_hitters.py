@@ -0,0 +1,138 @@
+import json
+
+import pandas as pd
+import streamlit as st
+
+from result_cache import cached_result
+
+# Counters kept per Space-Saving sketch, memory stays the same however many trips are added
+DESTINATION_SKETCH_CAPACITY = 100
+# Trips fed to the sketches at a time when building them from a loaded frame
+DESTINATION_SKETCH_CHUNK_SIZE = 50000
+# Key of the fleet-wide sketch next to the per-registration ones
+FLEET_SKETCH_KEY = 'All Registration Numbers'
+
+
+# Function to create an empty Space-Saving sketch
+def create_sketch(capacity=DESTINATION_SKETCH_CAPACITY):
+    return {'capacity': capacity, 'counts': {}, 'errors': {}}
+
+
+# Function to add weighted items to a sketch, the smallest counter is replaced once the sketch is full
+def update_sketch(sketch, item_counts):
+    counts = sketch['counts']
+    errors = sketch['errors']
+    for item, weight in item_counts.items():
+        if item in counts:
+            counts[item] += weight
+        elif len(counts) < sketch['capacity']:
+            counts[item] = weight
+            errors[item] = 0
+        else:
+            # The new item inherits the evicted count as its possible overestimate
+            smallest_item = min(counts, key=counts.get)
+            smallest_count = counts.pop(smallest_item)
+            errors.pop(smallest_item)
+            counts[item] = smallest_count + weight
+            errors[item] = smallest_count
+    return sketch
+
+
+# Function to merge two sketches, e.g. from two partitions, into a new one of the same capacity
+def merge_sketches(first_sketch, second_sketch):
+    capacity = max(first_sketch['capacity'], second_sketch['capacity'])
+    # An item missing from a full sketch may still have up to its smallest count there
+    first_floor = min(first_sketch['counts'].values()) if len(first_sketch['counts']) >= first_sketch['capacity'] else 0
+    second_floor = min(second_sketch['counts'].values()) if len(second_sketch['counts']) >= second_sketch['capacity'] else 0
+
+    merged_counts = {}
+    merged_errors = {}
+    for item in set(first_sketch['counts']) | set(second_sketch['counts']):
+        merged_counts[item] = first_sketch['counts'].get(item, first_floor) + second_sketch['counts'].get(item, second_floor)
+        merged_errors[item] = first_sketch['errors'].get(item, first_floor) + second_sketch['errors'].get(item, second_floor)
+
+    kept_items = sorted(merged_counts, key=lambda item: (-merged_counts[item], item))[:capacity]
+    return {
+        'capacity': capacity,
+        'counts': {item: merged_counts[item] for item in kept_items},
+        'errors': {item: merged_errors[item] for item in kept_items},
+    }
+
+
+# Function to get the top items of a sketch, with the lower bound that is guaranteed for each count
+def get_top_items(sketch, top_n, item_name='Item'):
+    top_items = sorted(sketch['counts'], key=lambda item: (-sketch['counts'][item], item))[:top_n]
+    return pd.DataFrame({
+        item_name: top_items,
+        'Trips': [sketch['counts'][item] for item in top_items],
+        'Guaranteed Trips': [max(sketch['counts'][item] - sketch['errors'][item], 0) for item in top_items],
+    })
+
+
+# Function to feed the out of geofence destinations of a batch of trips into per-registration and fleet-wide sketches
+def update_destination_sketches(sketches, trips_df):
+    out_of_geofence_df = trips_df[trips_df['End Geofence'].isnull()]
+    # Count each batch first, so the sketches see one weighted update per distinct destination
+    destination_counts = out_of_geofence_df.groupby(['Registration', 'End Location']).size()
+    for registration, registration_counts in destination_counts.groupby(level=0):
+        registration_sketch = sketches.setdefault(registration, create_sketch())
+        update_sketch(registration_sketch, registration_counts.droplevel(0).to_dict())
+    fleet_sketch = sketches.setdefault(FLEET_SKETCH_KEY, create_sketch())
+    update_sketch(fleet_sketch, destination_counts.groupby(level=1).sum().to_dict())
+    return sketches
+
+
+# Function to build the destination sketches from a loaded frame, streaming it in chunks
+@cached_result
+def build_destination_sketches(df, chunk_size=DESTINATION_SKETCH_CHUNK_SIZE):
+    sketches = {FLEET_SKETCH_KEY: create_sketch()}
+    for chunk_start in range(0, len(df), chunk_size):
+        update_destination_sketches(sketches, df.iloc[chunk_start:chunk_start + chunk_size])
+    return sketches
+
+
+# Function to save sketches as JSON, so they can be merged with sketches of later exports
+def save_sketches(sketches, path):
+    with open(path, 'w') as sketch_file:
+        json.dump(sketches, sketch_file, default=int)
+
+
+def load_sketches(path):
+    with open(path) as sketch_file:
+        return json.load(sketch_file)
+
+
+# Function to take exactly counted items back out of a sketch, counts stay upper bounds and guaranteed counts lower bounds
+def subtract_from_sketch(sketch, item_counts):
+    for item, weight in item_counts.items():
+        if item in sketch['counts']:
+            sketch['counts'][item] -= weight
+            # Every trip counted for the item was taken out again
+            if sketch['counts'][item] <= 0:
+                sketch['counts'].pop(item)
+                sketch['errors'].pop(item)
+    return sketch
+
+
+# Function to load the sketches saved during ingest, without the trips quarantined since
+@cached_result
+def load_destination_sketches(path, quarantine_df):
+    sketches = load_sketches(path)
+    out_of_geofence_df = quarantine_df[quarantine_df['End Geofence'].isnull()]
+    destination_counts = out_of_geofence_df.groupby(['Registration', 'End Location']).size()
+    for registration, registration_counts in destination_counts.groupby(level=0):
+        if registration in sketches:
+            subtract_from_sketch(sketches[registration], registration_counts.droplevel(0).to_dict())
+    subtract_from_sketch(sketches[FLEET_SKETCH_KEY], destination_counts.groupby(level=1).sum().to_dict())
+    return sketches
+
+
+def draw_top_destinations(sketches, selected_registration, top_n):
+    sketch = sketches.get(selected_registration)
+    if sketch is None or not sketch['counts']:
+        st.warning("No out of geofence trips found for the selected registration number.")
+        return
+
+    st.subheader("Top Out of Geofence Destinations:")
+    st.write("Trips is an upper bound on the true count, Guaranteed Trips a lower bound.")
+    st.table(get_top_items(sketch, top_n, 'End Location'))
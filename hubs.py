@@ -0,0 +1,155 @@
+import networkx as nx
+import numpy as np
+import pandas as pd
+import streamlit as st
+import matplotlib.pyplot as plt
+
+from result_cache import cached_result
+
+# Graphs with more locations than this use sampled betweenness and closeness
+HUB_SAMPLE_THRESHOLD = 500
+HUB_SAMPLE_SIZE = 200
+HUB_SAMPLE_SEED = 42
+# PageRank damping factor and convergence settings
+PAGERANK_DAMPING = 0.85
+PAGERANK_MAX_ITERATIONS = 100
+PAGERANK_TOLERANCE = 1e-8
+
+
+# Function to build the directed location graph, one edge per origin-destination pair weighted by trips
+def build_location_graph(df):
+    edges = df.groupby(['Start Location', 'End Location'])['Distance'].agg(['size', 'mean']).reset_index()
+    G = nx.DiGraph()
+    for start_location, end_location, trips, distance in edges.itertuples(index=False):
+        # Trips with a missing distance still count, they are treated as 0 km when routing
+        G.add_edge(start_location, end_location, trips=trips, distance=0 if pd.isnull(distance) else distance)
+    return G
+
+
+# Function to calculate PageRank hub scores with numpy power iteration, edges weighted by trips
+def calculate_pagerank(G, damping=PAGERANK_DAMPING, max_iterations=PAGERANK_MAX_ITERATIONS, tolerance=PAGERANK_TOLERANCE):
+    nodes = list(G)
+    node_count = len(nodes)
+    if node_count == 0:
+        return {}
+    position = {node: index for index, node in enumerate(nodes)}
+    sources = np.array([position[start] for start, _ in G.edges()], dtype=int)
+    targets = np.array([position[end] for _, end in G.edges()], dtype=int)
+    weights = np.array([trips for _, _, trips in G.edges(data='trips')], dtype=float)
+
+    out_weight = np.bincount(sources, weights=weights, minlength=node_count)
+    dangling = out_weight == 0
+    edge_share = weights / out_weight[sources]
+
+    scores = np.full(node_count, 1 / node_count)
+    for _ in range(max_iterations):
+        # Locations with no outgoing trips spread their score evenly
+        new_scores = np.bincount(targets, weights=scores[sources] * edge_share, minlength=node_count)
+        new_scores = damping * (new_scores + scores[dangling].sum() / node_count) + (1 - damping) / node_count
+        converged = np.abs(new_scores - scores).sum() < node_count * tolerance
+        scores = new_scores
+        if converged:
+            break
+    return dict(zip(nodes, scores))
+
+
+# Function to estimate closeness from a sample of source locations, scaled up to the whole graph
+def calculate_sampled_closeness(G, sample_size, seed):
+    nodes = list(G)
+    node_count = len(nodes)
+    rng = np.random.default_rng(seed)
+    sources = rng.choice(node_count, size=sample_size, replace=False)
+
+    reached = pd.Series(0.0, index=nodes)
+    total_distance = pd.Series(0.0, index=nodes)
+    for source in sources:
+        distances = pd.Series(nx.single_source_dijkstra_path_length(G, nodes[source], weight='distance'))
+        reached[distances.index] += 1
+        total_distance[distances.index] += distances
+
+    # Same improved formula as nx.closeness_centrality, with counts scaled from the sample
+    scale = node_count / sample_size
+    reached = reached * scale
+    total_distance = total_distance * scale
+    closeness = ((reached - 1) / (node_count - 1)) * ((reached - 1) / total_distance)
+    return closeness.where(total_distance > 0, 0).to_dict()
+
+
+# Function to group locations into communities of places that are driven between often
+def calculate_communities(G):
+    undirected = nx.Graph()
+    for start_location, end_location, trips in G.edges(data='trips'):
+        if undirected.has_edge(start_location, end_location):
+            undirected[start_location][end_location]['trips'] += trips
+        else:
+            undirected.add_edge(start_location, end_location, trips=trips)
+    communities = nx.algorithms.community.greedy_modularity_communities(undirected, weight='trips')
+
+    community_of_location = {}
+    # Communities come back largest first, so community 1 is the biggest
+    for community_number, community in enumerate(communities, start=1):
+        for location in community:
+            community_of_location[location] = community_number
+    return community_of_location
+
+
+# Function to calculate hub scores for every location, sampled centrality is used on large graphs
+@cached_result
+def calculate_hub_scores(df):
+    G = build_location_graph(df)
+    if G.number_of_nodes() == 0:
+        return pd.DataFrame(columns=['Location', 'Weighted Degree', 'Betweenness', 'Closeness', 'Hub Score', 'Community', 'Out of Geofence Visits'])
+
+    if G.number_of_nodes() > HUB_SAMPLE_THRESHOLD:
+        betweenness = nx.betweenness_centrality(G, k=HUB_SAMPLE_SIZE, weight='distance', seed=HUB_SAMPLE_SEED)
+        closeness = calculate_sampled_closeness(G, HUB_SAMPLE_SIZE, HUB_SAMPLE_SEED)
+    else:
+        betweenness = nx.betweenness_centrality(G, weight='distance')
+        closeness = nx.closeness_centrality(G, distance='distance')
+
+    hub_df = pd.DataFrame({
+        'Weighted Degree': pd.Series(dict(G.degree(weight='trips'))),
+        'Betweenness': pd.Series(betweenness),
+        'Closeness': pd.Series(closeness),
+        'Hub Score': pd.Series(calculate_pagerank(G)),
+        'Community': pd.Series(calculate_communities(G)),
+    })
+
+    # Trips starting or ending at a location outside any geofence make it a geofence or depot candidate
+    out_of_geofence_visits = pd.concat([
+        df.loc[df['Start Geofence'].isnull(), 'Start Location'],
+        df.loc[df['End Geofence'].isnull(), 'End Location'],
+    ]).value_counts()
+    hub_df['Out of Geofence Visits'] = out_of_geofence_visits.reindex(hub_df.index).fillna(0).astype(int)
+
+    hub_df = hub_df.round({'Betweenness': 4, 'Closeness': 4, 'Hub Score': 4})
+    hub_df = hub_df.sort_values('Hub Score', ascending=False).rename_axis('Location').reset_index()
+    return hub_df
+
+
+def draw_hubs(hub_df, top_n):
+    if hub_df.empty:
+        st.warning("No trips available for hub analysis.")
+        return
+
+    top_hubs = hub_df.head(top_n)
+
+    # Bar chart of the top hub scores
+    fig, ax = plt.subplots(figsize=(8, max(3, top_n * 0.35)))
+    ax.barh(top_hubs['Location'].str.split(',').str[0][::-1], top_hubs['Hub Score'][::-1], color='skyblue')
+    ax.set_xlabel('Hub Score')
+    ax.set_title('Top Location Hubs')
+    st.pyplot(fig)
+
+    st.subheader("Location Hubs:")
+    st.table(top_hubs)
+
+    # Communities ranked by how many out of geofence visits they hold
+    st.subheader("Communities:")
+    community_table = hub_df.groupby('Community').agg(**{
+        'Locations': ('Location', 'size'),
+        'Trips': ('Weighted Degree', 'sum'),
+        'Out of Geofence Visits': ('Out of Geofence Visits', 'sum'),
+        'Main Hub': ('Location', 'first'),
+    }).sort_values('Out of Geofence Visits', ascending=False)
+    st.table(community_table)
@@ -0,0 +1,69 @@
+import pandas as pd
+import streamlit as st
+
+from ledger import calculate_fuel_cost_series
+from result_cache import cached_result
+
+# Columns the leaderboard can be sorted by
+LEADERBOARD_SORT_COLUMNS = [
+    'Out of Geofence Fuel (%)',
+    'Out of Geofence Fuel Cost (TZS)',
+    'Total Fuel Cost (TZS)',
+    'Total Trips',
+    'Total Distance Covered (km)',
+]
+
+
+# Function to calculate on-route and out-of-route trips, distance and fuel cost for every registration number in one grouped pass
+@cached_result
+def calculate_fleet_leaderboard(df, cost_rates=None):
+    fuel_cost = calculate_fuel_cost_series(df['Distance'], cost_rates)
+    distance = df['Distance'].fillna(0)
+    on_route = (df['Start Geofence'].notnull() & df['End Geofence'].notnull()).astype(int)
+    out_of_route = (df['Start Geofence'].isnull() & df['End Geofence'].isnull()).astype(int)
+
+    # Per-trip contributions, so a single sum per registration number gives every column
+    trip_values = pd.DataFrame({
+        'Total Trips': 1,
+        'Within Geofence Trips': on_route,
+        'Out of Geofence Trips': out_of_route,
+        'Total Distance Covered (km)': distance,
+        'Out of Geofence Distance (km)': distance * out_of_route,
+        'Total Fuel Cost (TZS)': fuel_cost,
+        'Within Geofence Fuel Cost (TZS)': fuel_cost * on_route,
+        'Out of Geofence Fuel Cost (TZS)': fuel_cost * out_of_route,
+    }, index=df.index)
+    leaderboard = trip_values.groupby(df['Registration']).sum()
+
+    # Percentages over within and out of geofence fuel only, as in calculate_fuel_costs
+    compared_fuel_cost = leaderboard['Within Geofence Fuel Cost (TZS)'] + leaderboard['Out of Geofence Fuel Cost (TZS)']
+    leaderboard['Within Geofence Fuel (%)'] = leaderboard['Within Geofence Fuel Cost (TZS)'] / compared_fuel_cost * 100
+    leaderboard['Out of Geofence Fuel (%)'] = leaderboard['Out of Geofence Fuel Cost (TZS)'] / compared_fuel_cost * 100
+
+    leaderboard = leaderboard.round({
+        'Total Distance Covered (km)': 1,
+        'Out of Geofence Distance (km)': 1,
+        'Total Fuel Cost (TZS)': 0,
+        'Within Geofence Fuel Cost (TZS)': 0,
+        'Out of Geofence Fuel Cost (TZS)': 0,
+        'Within Geofence Fuel (%)': 2,
+        'Out of Geofence Fuel (%)': 2,
+    })
+    return leaderboard.reset_index()
+
+
+def draw_fleet_leaderboard(leaderboard, sort_by, ascending=False, min_trips=0):
+    ranked = leaderboard[leaderboard['Total Trips'] >= min_trips]
+    if ranked.empty:
+        st.warning("No registration numbers have enough trips for the leaderboard.")
+        return
+
+    ranked = ranked.sort_values(sort_by, ascending=ascending).reset_index(drop=True)
+    ranked.index = ranked.index + 1
+
+    st.subheader("Fleet Leaderboard:")
+    st.write(f"{len(ranked)} registration numbers, ranked by {sort_by}.")
+    st.dataframe(ranked)
+
+    # Bar chart of the out of geofence fuel share of each registration number
+    st.bar_chart(ranked.set_index('Registration')[['Out of Geofence Fuel (%)']])
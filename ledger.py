@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Cost rates used by the ledger, pass a dict with any of these keys to override them
+DEFAULT_COST_RATES = {
+    'fuel_consumption_per_km': 1 / 9,  # 1 litre covers 9 km
+    'fuel_cost_per_litre': 3100,  # 1 litre is sold at 3100 TZS
+    'per_diem_per_trip': 90000,  # Per diem paid per trip (TZS)
+    'maintenance_cost_per_km': 0,  # Maintenance is not costed yet (TZS per km)
+}
+
+# Column each ledger grain is reported under
+LEDGER_GRAINS = {
+    'Month': 'Start Month',
+    'Week': 'Start Week',
+    'Registration': 'Registration',
+    'Geofence Status': 'Geofence Status',
+}
+
+
+# Function to merge the given cost rates over the defaults
+def get_cost_rates(cost_rates=None):
+    rates = dict(DEFAULT_COST_RATES)
+    if cost_rates:
+        rates.update(cost_rates)
+    return rates
+
+
+# Function to calculate the fuel cost of every trip as a column, NaN distances are costed as 0
+def calculate_fuel_cost_series(distance, cost_rates=None):
+    rates = get_cost_rates(cost_rates)
+    return distance.fillna(0) * rates['fuel_consumption_per_km'] * rates['fuel_cost_per_litre']
+
+
+# Function to label each trip as within, out of or partly out of the geofence
+def get_geofence_status(df):
+    start_in_geofence = df['Start Geofence'].notnull()
+    end_in_geofence = df['End Geofence'].notnull()
+    status = np.select(
+        [start_in_geofence & end_in_geofence, ~start_in_geofence & ~end_in_geofence],
+        ['Within Geofence', 'Out of Geofence'],
+        default='Partly Out of Geofence'
+    )
+    return pd.Series(status, index=df.index)
+
+
+# Function to get the grouping key of a ledger grain, periods keep months and weeks in calendar order
+def get_ledger_key(df, grain):
+    if grain == 'Month':
+        return df['Start Time'].dt.to_period('M')
+    if grain == 'Week':
+        return df['Start Time'].dt.to_period('W')
+    if grain == 'Geofence Status':
+        return get_geofence_status(df)
+    return df[grain]
+
+
+# Function to calculate trips, distance, fuel, per diem and maintenance in one grouped aggregation
+def calculate_cost_ledger(df, grains=('Month',), cost_rates=None):
+    if isinstance(grains, str):
+        grains = [grains]
+    rates = get_cost_rates(cost_rates)
+
+    keys = [get_ledger_key(df, grain).rename(LEDGER_GRAINS[grain]) for grain in grains]
+    ledger = df['Distance'].fillna(0).groupby(keys).agg(['size', 'sum'])
+    ledger.columns = ['Total Trips', 'Total Distance Covered (km)']
+    ledger = add_ledger_costs(ledger.reset_index(), rates)
+
+    # Show months and weeks as readable labels once they have been sorted
+    if 'Month' in grains:
+        ledger['Start Month'] = ledger['Start Month'].dt.strftime('%B %Y')
+    if 'Week' in grains:
+        ledger['Start Week'] = ledger['Start Week'].dt.start_time.dt.strftime('Week of %d %b %Y')
+    return ledger
+
+
+# Function to derive the cost columns from the trip and distance totals, every cost component is linear in them
+def add_ledger_costs(ledger, cost_rates=None):
+    rates = get_cost_rates(cost_rates)
+    fuel_cost_per_km = rates['fuel_consumption_per_km'] * rates['fuel_cost_per_litre']
+    ledger['Total Fuel Cost (TZS)'] = (ledger['Total Distance Covered (km)'] * fuel_cost_per_km).round().astype(int)
+    ledger['Total Cost (Per Diem)'] = ledger['Total Trips'] * rates['per_diem_per_trip']
+    ledger['Total Maintenance Cost (TZS)'] = (ledger['Total Distance Covered (km)'] * rates['maintenance_cost_per_km']).round().astype(int)
+    ledger['Total Cost (TZS)'] = ledger['Total Fuel Cost (TZS)'] + ledger['Total Cost (Per Diem)'] + ledger['Total Maintenance Cost (TZS)']
+    ledger['Total Distance Covered (km)'] = ledger['Total Distance Covered (km)'].round(2)
+    return ledger
+
+
+def draw_cost_ledger(df, selected_grains, cost_rates):
+    if not selected_grains:
+        st.warning("Select at least one grain for the cost ledger.")
+        return
+
+    ledger = calculate_cost_ledger(df, selected_grains, cost_rates)
+
+    st.subheader("Cost Ledger:")
+    st.table(ledger)
+
+    st.write(f"Total Fuel Cost (TZS): {ledger['Total Fuel Cost (TZS)'].sum():,}")
+    st.write(f"Total Cost (Per Diem): {ledger['Total Cost (Per Diem)'].sum():,}")
+    st.write(f"Total Cost (TZS): {ledger['Total Cost (TZS)'].sum():,}")
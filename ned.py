@@ -4,6 +4,8 @@ import matplotlib.pyplot as plt
 import streamlit as st
 import networkx as nx
 import calendar
+from ledger import calculate_cost_ledger
+from trip_query import TripQuery
 
 st.set_option('deprecation.showPyplotGlobalUse', False)
 
@@ -16,25 +18,10 @@ def calculate_total_fuel_cost(distance):
 
 
 
-# Function to calculate the total fuel cost per month
-def calculate_total_fuel_cost_per_month(df):
-    df['Total Cost on Fuel (TZS)'] = df['Distance'].apply(calculate_total_fuel_cost)
-    total_fuel_cost_per_month = df.groupby(df['Start Month'])['Total Cost on Fuel (TZS)'].sum().reset_index(name='Total Fuel Cost')
-    return total_fuel_cost_per_month
-
-# Function to calculate the total fuel cost per month
-def calculate_total_fuel_cost_per_month(df):
-    df['Total Cost on Fuel (TZS)'] = df['Distance'].apply(calculate_total_fuel_cost)
-    total_fuel_cost_per_month = df.groupby(df['Start Month'])['Total Cost on Fuel (TZS)'].sum().reset_index(name='Total Fuel Cost')
-    total_distance_per_month = df.groupby(df['Start Month'])['Distance'].sum().reset_index(name='Total Distance Covered')
-    total_trips_per_month = df.groupby(df['Start Month']).size().reset_index(name='Total Trips')
-    total_cost_per_month = total_trips_per_month['Total Trips'] * 90000  # Per diem cost calculation
-    
-    # Combine the calculated values into a single dataframe
-    total_monthly_data = pd.concat([total_trips_per_month['Start Month'], total_trips_per_month['Total Trips'], total_distance_per_month['Total Distance Covered'], total_fuel_cost_per_month['Total Fuel Cost'], total_cost_per_month], axis=1)
-    total_monthly_data.columns = ['Start Month', 'Total Trips', 'Total Distance Covered (km)', 'Total Fuel Cost (TZS)', 'Total Cost (Per Diem)']
-    
-    return total_monthly_data
+# Function to calculate the total trips, distance, fuel cost and per diem per month in one grouped pass
+def calculate_total_fuel_cost_per_month(df, cost_rates=None):
+    total_monthly_data = calculate_cost_ledger(df, 'Month', cost_rates)
+    return total_monthly_data[['Start Month', 'Total Trips', 'Total Distance Covered (km)', 'Total Fuel Cost (TZS)', 'Total Cost (Per Diem)']]
 
 
 def plot_null_values(data, column):
@@ -67,10 +54,11 @@ def plot_null_values(data, column):
 
 def draw_network_graph(df, selected_registration, selected_start_location, show_trips_per_day):
     # Filter the dataframe based on the selected registration number and start location
-    filtered_df = df[(df['Registration'] == selected_registration) & (df['Start Location'] == selected_start_location)]
+    selection_query = TripQuery(df).registration(selected_registration).start_location(selected_start_location)
+    filtered_df = selection_query.collect()
 
     # Limit to only 5 trips for network diagram
-    filtered_df_network = filtered_df.head(5)
+    filtered_df_network = selection_query.limit(5).collect()
 
     # Create a directed graph
     G = nx.DiGraph()
@@ -116,12 +104,10 @@ def draw_network_graph(df, selected_registration, selected_start_location, show_
 
     total_trips_per_month = pd.concat([total_trips_per_month, totals_row], ignore_index=True)
 
-    # Calculate total fuel cost per month
-    total_fuel_cost_per_month = calculate_total_fuel_cost_per_month(filtered_df_network)
-    # Add total distance covered for the selected registration number to the table
-    total_fuel_cost_per_month['Total Distance Covered (km)'] = filtered_df['Distance'].sum()
+    # Calculate total trips, distance and fuel cost per month for all trips of the selected registration number and start location
+    total_fuel_cost_per_month = calculate_total_fuel_cost_per_month(filtered_df)
 
-    st.write("Total Fuel Cost per Month (Network Diagram):")
+    st.write("Total Fuel Cost per Month:")
     st.table(total_fuel_cost_per_month)
 
     st.write("Total Number of Trips per Month:")
@@ -134,10 +120,11 @@ def draw_network_graph(df, selected_registration, selected_start_location, show_
 
 def draw_out_of_route_network_graph(df, selected_registration, selected_start_location, show_trips_per_day_out_of_route):
     # Filter the dataframe for trips where both Start and End Geofence are null (Out of Route)
-    out_of_route_df = df[(df['Start Geofence'].isnull()) & (df['End Geofence'].isnull()) & (df['Registration'] == selected_registration) & (df['Start Location'] == selected_start_location)]
+    out_of_route_query = TripQuery(df).geofence_status('Out of Geofence').registration(selected_registration).start_location(selected_start_location)
+    out_of_route_df = out_of_route_query.collect()
 
     # Limit to only 5 trips for out of route network diagram
-    out_of_route_df_network = out_of_route_df.head(5)
+    out_of_route_df_network = out_of_route_query.limit(5).collect()
 
     # Create a directed graph for out of route network diagram
     G = nx.DiGraph()
@@ -183,13 +170,8 @@ def draw_out_of_route_network_graph(df, selected_registration, selected_start_lo
 
     total_out_of_route_per_month = pd.concat([total_out_of_route_per_month, totals_row], ignore_index=True)
 
-    # Calculate total fuel cost per month for out of route trips
-    total_fuel_cost_out_of_route_per_month = calculate_total_fuel_cost_per_month(out_of_route_df_network)
-    # Check if the column exists in the DataFrame before rounding
-    if 'Total Fuel Cost (TZS)' in total_fuel_cost_out_of_route_per_month.columns:
-        total_fuel_cost_out_of_route_per_month['Total Fuel Cost (TZS)'] = total_fuel_cost_out_of_route_per_month['Total Fuel Cost (TZS)'].apply(lambda x: round(x)).astype(int)
-    # Add total distance covered for the selected registration number to the table
-    total_fuel_cost_out_of_route_per_month['Total Distance Covered (km)'] = out_of_route_df['Distance'].sum()
+    # Calculate total trips, distance and fuel cost per month for all out of route trips
+    total_fuel_cost_out_of_route_per_month = calculate_total_fuel_cost_per_month(out_of_route_df)
 
     st.write("Total Fuel Cost per Month (Out of Route):")
     st.table(total_fuel_cost_out_of_route_per_month)
@@ -204,25 +186,9 @@ def draw_out_of_route_network_graph(df, selected_registration, selected_start_lo
 
 # Function to filter DataFrame based on selected day of the week
 def filter_trips_by_day(df, selected_day):
-    selected_day_trips = df[df['Start Time'].dt.day_name() == selected_day]
+    selected_day_trips = TripQuery(df).day_of_week(selected_day).collect()
     return selected_day_trips
 
-# Visualization options
-st.sidebar.title("Visualization Options")
-selected_option = st.sidebar.radio("Select Option", ["Trips Out of Geofence Fuel Consumption vs Trips Within Geofence Fuel Consumption", "Trips that Started Out of Geofence", "Trips that Ended Out of Geofence", "Trips Within the Geofence Analysis", "Trips Out of Geofence Analysis", "Trips by Day Analysis", "Trips by Day Analysis"])
-
-# If "Trips by Day Analysis" is selected, allow the user to select the day of the week
-if selected_option == "Trips by Day Analysis":
-    selected_day = st.sidebar.selectbox("Select Day of the Week", ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])
-
-    # Filter the DataFrame based on the selected day of the week
-    filtered_df_by_day = filter_trips_by_day(df, selected_day)
-
-    # Display the number of trips on the selected day of the week
-    st.write(f"Number of trips on {selected_day}: {len(filtered_df_by_day)}")
-
-
-
 def draw_trips_per_day_chart(df):
     # Line chart showing trips made per day
     trips_per_day_chart = df.groupby(df['Start Time'].dt.date).size().reset_index(name='Trips per Day')
@@ -283,7 +249,7 @@ Moving forward, version 2 will evolve into a predictive tool that will optimize
         else:
             # Visualization options
             st.sidebar.title("Visualization Options")
-            selected_option = st.sidebar.radio("Select Option", ["Trips that Started Out of Geofence", "Trips that Ended Out of Geofence", "Trips Within the Geofence Analysis", "Trips Out of Geofence Analysis", "Trips Out of Geofence Fuel Consumption vs Trips Within Geofence Fuel Consumption"])
+            selected_option = st.sidebar.radio("Select Option", ["Trips that Started Out of Geofence", "Trips that Ended Out of Geofence", "Trips Within the Geofence Analysis", "Trips Out of Geofence Analysis", "Trips Out of Geofence Fuel Consumption vs Trips Within Geofence Fuel Consumption", "Trips by Day Analysis"])
 
             if selected_option == "Trips that Started Out of Geofence":
                 plot_null_values(df, 'Start Geofence')
@@ -340,7 +306,7 @@ Moving forward, version 2 will evolve into a predictive tool that will optimize
                     registration_options = df['Registration'].unique()
                     selected_registration_fuel_comparison = st.selectbox("Select Registration Number", registration_options)
                     # Filter the dataframe based on the selected registration number
-                    filtered_df_fuel_comparison = df[df['Registration'] == selected_registration_fuel_comparison]
+                    filtered_df_fuel_comparison = TripQuery(df).registration(selected_registration_fuel_comparison).collect()
 
                 # Calculate total fuel cost for both on-route and out-of-route trips
                 on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route = calculate_total_fuel_cost(filtered_df_fuel_comparison)
@@ -360,6 +326,18 @@ Moving forward, version 2 will evolve into a predictive tool that will optimize
                 st.markdown("<br>", unsafe_allow_html=True)
                 st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
 
+            elif selected_option == "Trips by Day Analysis":
+                # Select the day of the week
+                selected_day = st.sidebar.selectbox("Select Day of the Week", ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"])
+
+                # Filter the DataFrame based on the selected day of the week
+                filtered_df_by_day = filter_trips_by_day(df, selected_day)
+
+                # Display the number of trips on the selected day of the week
+                st.write(f"Number of trips on {selected_day}: {len(filtered_df_by_day)}")
+                st.markdown("<br>", unsafe_allow_html=True)
+                st.markdown("Product of the IS Team. All Rights Reserved. &copy; 2024")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,59 @@
+import math
+
+import pandas as pd
+import streamlit as st
+
+# Rows per page the user can choose from
+PAGE_SIZES = [10, 25, 50, 100]
+NO_SORT = '(Original Order)'
+
+
+# Function to turn month labels like "October 2023" into dates, so months sort in calendar order
+def get_month_sort_key(months):
+    return pd.to_datetime(months, format='%B %Y')
+
+
+# Function to get the row positions of a table in sorted order, a stable sort so equal values keep their original order
+def get_sort_positions(df, sort_column, ascending=True, sort_key=None):
+    sort_values = df[sort_column] if sort_key is None else sort_key(df[sort_column])
+    return sort_values.reset_index(drop=True).sort_values(ascending=ascending, kind='mergesort').index.to_numpy()
+
+
+# Function to slice one page of a table, optionally sorted by a column
+def get_table_page(df, page, page_size, sort_column=None, ascending=True, sort_key=None):
+    start = (page - 1) * page_size
+    end = min(start + page_size, len(df))
+    if sort_column is None:
+        return df.iloc[start:end]
+    return df.iloc[get_sort_positions(df, sort_column, ascending, sort_key)[start:end]]
+
+
+# Function to draw a table one page at a time, only the visible page is sent to the browser.
+# sort_keys maps a sort column to a function giving the values it is sorted by, e.g. get_month_sort_key
+def draw_paginated_table(df, key, sort_columns=None, total_columns=None, sort_keys=None):
+    if df.empty:
+        st.write("No rows to show.")
+        return
+
+    sort_column_col, ascending_col, page_size_col, page_col = st.columns(4)
+    with sort_column_col:
+        sort_column = st.selectbox("Sort By", [NO_SORT] + list(sort_columns or []), key=f"{key}_sort_column")
+    with ascending_col:
+        ascending = st.selectbox("Order", ["Ascending", "Descending"], key=f"{key}_order") == "Ascending"
+    with page_size_col:
+        page_size = st.selectbox("Rows per Page", PAGE_SIZES, key=f"{key}_page_size")
+    page_count = math.ceil(len(df) / page_size)
+    with page_col:
+        # Keyed on the page count, so a new selection or page size starts again from page 1
+        page = int(st.number_input(f"Page (of {page_count})", min_value=1, max_value=page_count, value=1, key=f"{key}_page_{page_count}"))
+
+    sort_column = None if sort_column == NO_SORT else sort_column
+    page_df = get_table_page(df, page, page_size, sort_column, ascending, (sort_keys or {}).get(sort_column))
+
+    # Add a 'Totals' row over every row of the table, not just the visible page
+    if total_columns:
+        totals_row = pd.DataFrame({column: [df[column].sum()] for column in total_columns}, index=['Totals'])
+        page_df = pd.concat([page_df.set_axis(page_df.index.astype(str), axis=0), totals_row])
+
+    st.table(page_df)
+    st.write(f"Showing rows {(page - 1) * page_size + 1} to {min(page * page_size, len(df))} of {len(df)}.")
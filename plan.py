@@ -4,6 +4,7 @@ import matplotlib.pyplot as plt
 import streamlit as st
 import networkx as nx
 import calendar
+from trip_query import TripQuery
 
 st.set_option('deprecation.showPyplotGlobalUse', False)
 
@@ -22,8 +23,8 @@ def calculate_total_fuel_cost_per_month(df):
 
 # Function to calculate fuel costs and percentages for the selected month
 def calculate_fuel_costs(df):
-    on_route_df = df[~df['Start Geofence'].isnull() & ~df['End Geofence'].isnull()]
-    out_of_route_df = df[df['Start Geofence'].isnull() & df['End Geofence'].isnull()]
+    on_route_df = TripQuery(df).geofence_status('Within Geofence').collect()
+    out_of_route_df = TripQuery(df).geofence_status('Out of Geofence').collect()
 
     on_route_fuel_cost = on_route_df['Distance'].apply(calculate_total_fuel_cost).sum()
     out_of_route_fuel_cost = out_of_route_df['Distance'].apply(calculate_total_fuel_cost).sum()
@@ -65,10 +66,11 @@ def plot_null_values(data, column):
 
 def draw_network_graph(df, selected_registration, selected_start_location, show_trips_per_day):
     # Filter the dataframe based on the selected registration number and start location
-    filtered_df = df[(df['Registration'] == selected_registration) & (df['Start Location'] == selected_start_location)]
+    selection_query = TripQuery(df).registration(selected_registration).start_location(selected_start_location)
+    filtered_df = selection_query.collect()
 
     # Limit to only 5 trips for network diagram
-    filtered_df_network = filtered_df.head(5)
+    filtered_df_network = selection_query.limit(5).collect()
 
     # Create a directed graph
     G = nx.DiGraph()
@@ -131,10 +133,11 @@ def draw_network_graph(df, selected_registration, selected_start_location, show_
 
 def draw_out_of_route_network_graph(df, selected_registration, selected_start_location, show_trips_per_day_out_of_route):
     # Filter the dataframe for trips where both Start and End Geofence are null (Out of Route)
-    out_of_route_df = df[(df['Start Geofence'].isnull()) & (df['End Geofence'].isnull()) & (df['Registration'] == selected_registration) & (df['Start Location'] == selected_start_location)]
+    out_of_route_query = TripQuery(df).geofence_status('Out of Geofence').registration(selected_registration).start_location(selected_start_location)
+    out_of_route_df = out_of_route_query.collect()
 
     # Limit to only 5 trips for out of route network diagram
-    out_of_route_df_network = out_of_route_df.head(5)
+    out_of_route_df_network = out_of_route_query.limit(5).collect()
 
     # Create a directed graph for out of route network diagram
     G = nx.DiGraph()
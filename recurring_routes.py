@@ -0,0 +1,119 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ledger import calculate_fuel_cost_series
+from result_cache import cached_result
+
+# MinHash signature length, split into LSH bands of rows; days agreeing on every row of a band become candidates
+MINHASH_SIZE = 64
+LSH_BANDS = 16
+LSH_ROWS = MINHASH_SIZE // LSH_BANDS
+MINHASH_SEED = 42
+# Large prime for the MinHash hash functions
+MINHASH_PRIME = 2 ** 31 - 1
+# Estimated Jaccard similarity a candidate day needs to join a route
+ROUTE_SIMILARITY_THRESHOLD = 0.6
+# Days a set of locations must be driven on to count as a recurring route
+ROUTE_MIN_DAYS = 3
+# Locations listed to describe a route
+ROUTE_DESCRIPTION_LOCATIONS = 4
+
+
+# Function to turn each vehicle-day into its set of visited locations, with its distance and fuel cost
+def build_vehicle_days(df):
+    trips = df[df['Start Time'].notnull()]
+    day = trips['Start Time'].dt.normalize()
+    visits = pd.concat([
+        pd.DataFrame({'Registration': trips['Registration'], 'Date': day, 'Location': trips['Start Location']}),
+        pd.DataFrame({'Registration': trips['Registration'], 'Date': day, 'Location': trips['End Location']}),
+    ]).dropna().drop_duplicates()
+
+    day_totals = pd.DataFrame({
+        'Distance': trips['Distance'].fillna(0),
+        'Fuel Cost': calculate_fuel_cost_series(trips['Distance']),
+    }).groupby([trips['Registration'], day.rename('Date')]).sum()
+    return visits, day_totals
+
+
+# Function to compute the MinHash signature of every vehicle-day at once, the minimum of each hash function over the day's locations
+def calculate_minhash_signatures(visits, day_keys):
+    location_codes = pd.factorize(visits['Location'])[0].astype(np.int64)
+    rng = np.random.default_rng(MINHASH_SEED)
+    a = rng.integers(1, MINHASH_PRIME, size=MINHASH_SIZE, dtype=np.int64)
+    b = rng.integers(0, MINHASH_PRIME, size=MINHASH_SIZE, dtype=np.int64)
+    hashes = (location_codes[:, None] * a + b) % MINHASH_PRIME
+
+    # Visits sorted by day, so each day's rows are one contiguous run for reduceat
+    order = np.argsort(day_keys, kind='stable')
+    sorted_keys = day_keys[order]
+    run_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+    return np.minimum.reduceat(hashes[order], run_starts, axis=0)
+
+
+# Function to cluster similar days with LSH banding and a union-find, no pair of days is compared outside a shared bucket
+def cluster_signatures(signatures, threshold=ROUTE_SIMILARITY_THRESHOLD):
+    parent = np.arange(len(signatures))
+
+    def find(day):
+        while parent[day] != day:
+            parent[day] = parent[parent[day]]
+            day = parent[day]
+        return day
+
+    for band in range(LSH_BANDS):
+        band_rows = np.ascontiguousarray(signatures[:, band * LSH_ROWS:(band + 1) * LSH_ROWS])
+        bucket_codes = pd.factorize(pd.Series(list(map(bytes, band_rows))))[0]
+        for bucket_days in pd.Series(np.arange(len(signatures))).groupby(bucket_codes).indices.values():
+            if len(bucket_days) < 2:
+                continue
+            # Routes are only merged when their first days agree closely enough, so a route cannot drift through a chain of similar days
+            for day in bucket_days[1:]:
+                route, other_route = find(bucket_days[0]), find(day)
+                if route != other_route and (signatures[route] == signatures[other_route]).mean() >= threshold:
+                    parent[max(route, other_route)] = min(route, other_route)
+
+    return np.array([find(day) for day in range(len(signatures))])
+
+
+# Function to find each vehicle's recurring routes across the whole fleet in near-linear time
+@cached_result
+def find_recurring_routes(df, min_days=ROUTE_MIN_DAYS):
+    visits, day_totals = build_vehicle_days(df)
+    if visits.empty:
+        return pd.DataFrame(columns=['Route', 'Registration', 'Days', 'Locations', 'Average Distance (km)', 'Average Fuel Cost (TZS)'])
+
+    day_index = pd.MultiIndex.from_frame(visits[['Registration', 'Date']])
+    day_keys, days = pd.factorize(day_index)
+    signatures = calculate_minhash_signatures(visits, day_keys)
+    # factorize numbers days in order of appearance and reduceat follows sorted keys, so signature i belongs to days[i]
+    routes = pd.Series(cluster_signatures(signatures), index=days, name='Route')
+
+    day_routes = day_totals.join(routes.rename_axis(['Registration', 'Date']), how='inner').reset_index()
+    visits = visits.join(routes.rename_axis(['Registration', 'Date']), on=['Registration', 'Date'])
+    route_locations = visits.groupby('Route')['Location'].agg(lambda locations: ' | '.join(locations.value_counts().index[:ROUTE_DESCRIPTION_LOCATIONS]))
+
+    recurring = day_routes.groupby(['Route', 'Registration']).agg(**{
+        'Days': ('Date', 'size'),
+        'Average Distance (km)': ('Distance', 'mean'),
+        'Average Fuel Cost (TZS)': ('Fuel Cost', 'mean'),
+    }).reset_index()
+    recurring = recurring[recurring['Days'] >= min_days]
+    recurring['Locations'] = recurring['Route'].map(route_locations)
+    # Routes are renumbered from 1, most driven first
+    route_days = recurring.groupby('Route')['Days'].transform('sum')
+    recurring = recurring.assign(**{'Route Days': route_days}).sort_values(['Route Days', 'Route', 'Days'], ascending=False)
+    recurring['Route'] = pd.factorize(recurring['Route'])[0] + 1
+    recurring = recurring.round({'Average Distance (km)': 1, 'Average Fuel Cost (TZS)': 0})
+    return recurring[['Route', 'Registration', 'Days', 'Locations', 'Average Distance (km)', 'Average Fuel Cost (TZS)']].reset_index(drop=True)
+
+
+def draw_recurring_routes(recurring_routes, selected_registration=None):
+    routes = recurring_routes if selected_registration is None else recurring_routes[recurring_routes['Registration'] == selected_registration]
+    if routes.empty:
+        st.warning("No recurring routes found for the selected registration number.")
+        return
+
+    st.subheader("Recurring Routes:")
+    st.write(f"{routes['Route'].nunique()} routes driven on at least {ROUTE_MIN_DAYS} days, {routes['Days'].sum()} vehicle-days in total.")
+    st.table(routes)
@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+# Memory budget for results shared by every session in the process
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
+# Cached results in least recently used order, with their estimated size in bytes
+result_cache_lock = threading.Lock()
+result_cache_entries = OrderedDict()
+result_cache_size = 0
+# Hit, miss and eviction counters per cached function
+result_cache_stats = {}
+# Version of the loaded dataset, part of every cache key
+dataset_version = None
+
+
+# Function to get the version of a dataset file, it changes whenever the file is rewritten
+def get_dataset_version(path):
+    file_stat = os.stat(path)
+    return f"{os.path.basename(path)}:{file_stat.st_mtime_ns}:{file_stat.st_size}"
+
+
+# Function to set the dataset version, results of older versions are dropped
+def set_dataset_version(version):
+    global dataset_version, result_cache_size
+    with result_cache_lock:
+        if version != dataset_version:
+            result_cache_entries.clear()
+            result_cache_size = 0
+            dataset_version = version
+
+
+# Function to identify a frame or series by its contents, two frames with the same shape and labels but different values get different keys
+def hash_pandas_contents(data):
+    return hashlib.blake2b(pd.util.hash_pandas_object(data).values.tobytes(), digest_size=16).hexdigest()
+
+
+# Function to turn call arguments into a hashable cache key
+def normalize_argument(argument):
+    if isinstance(argument, pd.DataFrame):
+        return ('DataFrame', tuple(argument.columns), len(argument), hash_pandas_contents(argument))
+    if isinstance(argument, pd.Series):
+        return ('Series', argument.name, len(argument), hash_pandas_contents(argument))
+    if isinstance(argument, dict):
+        return tuple(sorted((key, normalize_argument(value)) for key, value in argument.items()))
+    if isinstance(argument, (list, tuple)):
+        return tuple(normalize_argument(value) for value in argument)
+    if isinstance(argument, np.generic):
+        return argument.item()
+    return argument
+
+
+# Function to estimate the memory held by a cached result, containers are counted with everything they hold
+def estimate_result_size(result):
+    if isinstance(result, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(np.sum(result.memory_usage(deep=True)))
+    if isinstance(result, np.ndarray):
+        return result.nbytes
+    if isinstance(result, (list, tuple, set)):
+        return sys.getsizeof(result) + sum(estimate_result_size(value) for value in result)
+    if isinstance(result, dict):
+        return sys.getsizeof(result) + sum(estimate_result_size(key) + estimate_result_size(value) for key, value in result.items())
+    return sys.getsizeof(result)
+
+
+# Function to store a result, evicting the least recently used ones to stay within the memory budget
+def store_result(key, result, function_name):
+    global result_cache_size
+    result_size = estimate_result_size(result)
+    if result_size > RESULT_CACHE_MAX_BYTES:
+        return
+
+    with result_cache_lock:
+        if key in result_cache_entries:
+            return
+        while result_cache_entries and result_cache_size + result_size > RESULT_CACHE_MAX_BYTES:
+            evicted_key, (_, evicted_size) = result_cache_entries.popitem(last=False)
+            result_cache_size -= evicted_size
+            result_cache_stats[evicted_key[0]]['Evictions'] += 1
+        result_cache_entries[key] = (result, result_size)
+        result_cache_size += result_size
+
+
+# Decorator to serve a function's results from the shared cache, cached results must not be modified by callers
+def cached_result(function):
+    # Qualified by module, so functions of the same name in different modules never share entries
+    function_name = f"{function.__module__}.{function.__qualname__}"
+    result_cache_stats.setdefault(function_name, {'Hits': 0, 'Misses': 0, 'Evictions': 0})
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        key = (function_name, normalize_argument(args), normalize_argument(kwargs), dataset_version)
+        with result_cache_lock:
+            if key in result_cache_entries:
+                result_cache_entries.move_to_end(key)
+                result_cache_stats[function_name]['Hits'] += 1
+                return result_cache_entries[key][0]
+            result_cache_stats[function_name]['Misses'] += 1
+
+        result = function(*args, **kwargs)
+        store_result(key, result, function_name)
+        return result
+
+    return wrapper
+
+
+# Function to get the cache counters per function as a table
+def get_result_cache_stats():
+    with result_cache_lock:
+        stats_table = pd.DataFrame.from_dict(result_cache_stats, orient='index')
+        entries_per_function = pd.Series([key[0] for key in result_cache_entries], dtype=object).value_counts()
+        cache_size = result_cache_size
+    stats_table['Cached Results'] = entries_per_function.reindex(stats_table.index).fillna(0).astype(int)
+    return stats_table, cache_size
+
+
+def draw_result_cache_stats():
+    stats_table, cache_size = get_result_cache_stats()
+    st.sidebar.write(f"Result cache: {cache_size / 1024 / 1024:.1f} MB of {RESULT_CACHE_MAX_BYTES / 1024 / 1024:.0f} MB")
+    st.sidebar.table(stats_table)
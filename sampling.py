@@ -0,0 +1,116 @@
+import math
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from ledger import calculate_fuel_cost_series
+from result_cache import cached_result
+
+# Trips are sampled within each registration number and month
+SAMPLE_STRATA = ['Registration', 'Sample Month']
+SAMPLE_FRACTION = 0.2
+# Keep a couple of trips from every stratum so each one has a variance estimate
+SAMPLE_MIN_PER_STRATUM = 2
+SAMPLE_SEED = 42
+# z value for a 95% confidence interval
+CONFIDENCE_Z = 1.96
+
+# Exact answers are computed in the background and kept once they are ready, the least recently used are dropped past the limit
+EXACT_RESULT_MAX_ENTRIES = 64
+exact_result_executor = ThreadPoolExecutor(max_workers=2)
+exact_result_lock = threading.Lock()
+exact_result_futures = OrderedDict()
+
+
+# Function to draw a stratified sample of the trips, with the size of the stratum each trip stands for
+@cached_result
+def build_stratified_sample(df, fraction=SAMPLE_FRACTION, min_per_stratum=SAMPLE_MIN_PER_STRATUM, seed=SAMPLE_SEED):
+    sample_df = df.copy()
+    sample_df['Sample Month'] = sample_df['Start Time'].dt.to_period('M')
+    grouped = sample_df.groupby(SAMPLE_STRATA, sort=False)
+
+    # Rank trips within their stratum in a random order and keep the first m of each
+    rng = np.random.default_rng(seed)
+    sample_df['Sample Order'] = rng.random(len(sample_df))
+    rank = grouped['Sample Order'].rank(method='first')
+    stratum_size = grouped['Sample Order'].transform('size')
+    stratum_sample_size = np.minimum(np.maximum(np.ceil(stratum_size * fraction), min_per_stratum), stratum_size)
+
+    sample_df['Stratum Size'] = stratum_size
+    sample_df['Stratum Sample Size'] = stratum_sample_size
+    sample_df = sample_df[rank <= stratum_sample_size]
+    return sample_df.drop(columns='Sample Order')
+
+
+# Function to estimate per-stratum totals and variances of a per-trip value column
+def calculate_stratum_estimates(sample_df, values):
+    strata = sample_df.groupby(SAMPLE_STRATA, sort=False)
+    stratum_df = pd.DataFrame({
+        'N': strata['Stratum Size'].first(),
+        'm': strata['Stratum Sample Size'].first(),
+        'mean': values.groupby([sample_df[column] for column in SAMPLE_STRATA], sort=False).mean(),
+        'var': values.groupby([sample_df[column] for column in SAMPLE_STRATA], sort=False).var().fillna(0),
+    })
+    # Variance of the stratum total with the finite population correction
+    stratum_df['total'] = stratum_df['N'] * stratum_df['mean']
+    stratum_df['total var'] = stratum_df['N'] ** 2 * (1 - stratum_df['m'] / stratum_df['N']) * stratum_df['var'] / stratum_df['m']
+    return stratum_df
+
+
+# Function to estimate the total of a per-trip value with the half width of its confidence interval
+def estimate_total(sample_df, values):
+    stratum_df = calculate_stratum_estimates(sample_df, values)
+    return stratum_df['total'].sum(), CONFIDENCE_Z * math.sqrt(stratum_df['total var'].sum())
+
+
+# Function to estimate a ratio of two totals, with the confidence interval from the linearised residuals
+def estimate_ratio(sample_df, numerator, denominator):
+    numerator_total, _ = estimate_total(sample_df, numerator)
+    denominator_total, _ = estimate_total(sample_df, denominator)
+    if denominator_total == 0:
+        return float('nan'), float('nan')
+    ratio = numerator_total / denominator_total
+    _, residual_margin = estimate_total(sample_df, numerator - ratio * denominator)
+    return ratio, residual_margin / denominator_total
+
+
+# Function to estimate fuel costs and percentages from the sample, each with its 95% margin of error
+def estimate_fuel_costs(sample_df, domain_mask=None):
+    fuel_cost = calculate_fuel_cost_series(sample_df['Distance'])
+    # Trips outside the domain (e.g. a date range cutting through a month) count as 0 so stratum sizes stay valid
+    if domain_mask is not None:
+        fuel_cost = fuel_cost.where(domain_mask, 0)
+    on_route = sample_df['Start Geofence'].notnull() & sample_df['End Geofence'].notnull()
+    out_of_route = sample_df['Start Geofence'].isnull() & sample_df['End Geofence'].isnull()
+
+    on_route_fuel_cost = fuel_cost.where(on_route, 0)
+    out_of_route_fuel_cost = fuel_cost.where(out_of_route, 0)
+    compared_fuel_cost = on_route_fuel_cost + out_of_route_fuel_cost
+
+    on_route_estimate = estimate_total(sample_df, on_route_fuel_cost)
+    out_of_route_estimate = estimate_total(sample_df, out_of_route_fuel_cost)
+    percentage_on_route, on_route_margin = estimate_ratio(sample_df, on_route_fuel_cost, compared_fuel_cost)
+    percentage_out_of_route, out_of_route_margin = estimate_ratio(sample_df, out_of_route_fuel_cost, compared_fuel_cost)
+
+    return (
+        on_route_estimate,
+        out_of_route_estimate,
+        (percentage_on_route * 100, on_route_margin * 100),
+        (percentage_out_of_route * 100, out_of_route_margin * 100),
+    )
+
+
+# Function to start computing an exact answer in the background, or get the one already running
+def submit_exact_result(key, function, *args):
+    with exact_result_lock:
+        if key in exact_result_futures:
+            exact_result_futures.move_to_end(key)
+            return exact_result_futures[key]
+        exact_result_futures[key] = exact_result_executor.submit(function, *args)
+        # Keys carry the dataset version, so answers for older versions are the first to go
+        while len(exact_result_futures) > EXACT_RESULT_MAX_ENTRIES:
+            exact_result_futures.popitem(last=False)
+        return exact_result_futures[key]
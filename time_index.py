@@ -0,0 +1,47 @@
+import pandas as pd
+
+from result_cache import cached_result
+
+
+# Function to sort the trips by Start Time once and index each registration number's positions in that order
+@cached_result
+def build_time_index(df):
+    # Trips without a Start Time cannot fall in any date range
+    sorted_df = df[df['Start Time'].notnull()].sort_values('Start Time', kind='mergesort')
+    start_times = pd.DatetimeIndex(sorted_df['Start Time'])
+
+    # Positions of a registration number's trips are ascending, so their Start Times are sorted too
+    registration_index = {}
+    for registration, positions in sorted_df.groupby('Registration').indices.items():
+        registration_index[registration] = (start_times[positions], positions)
+
+    return {'df': sorted_df, 'start_times': start_times, 'registrations': registration_index}
+
+
+# Function to get the bounds of a date range as timestamps, the end date is included
+def get_date_range_bounds(start_date, end_date):
+    return pd.Timestamp(start_date), pd.Timestamp(end_date) + pd.Timedelta(days=1)
+
+
+# Function to slice the trips that started in a date range with two binary searches, optionally for one registration number
+def slice_date_range(time_index, start_date, end_date, registration=None):
+    range_start, range_end = get_date_range_bounds(start_date, end_date)
+    if registration is None:
+        start_position = time_index['start_times'].searchsorted(range_start, side='left')
+        end_position = time_index['start_times'].searchsorted(range_end, side='left')
+        return time_index['df'].iloc[start_position:end_position]
+
+    if registration not in time_index['registrations']:
+        return time_index['df'].iloc[:0]
+    start_times, positions = time_index['registrations'][registration]
+    start_position = start_times.searchsorted(range_start, side='left')
+    end_position = start_times.searchsorted(range_end, side='left')
+    return time_index['df'].iloc[positions[start_position:end_position]]
+
+
+# Function to find the positions of a date range in any frame already sorted by Start Time, e.g. the stratified sample
+def get_sorted_range_positions(sorted_df, start_date, end_date):
+    range_start, range_end = get_date_range_bounds(start_date, end_date)
+    start_position = sorted_df['Start Time'].searchsorted(range_start, side='left')
+    end_position = sorted_df['Start Time'].searchsorted(range_end, side='left')
+    return start_position, end_position
@@ -0,0 +1,82 @@
+import matplotlib.pyplot as plt
+import matplotlib.dates as mdates
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ledger import get_geofence_status
+from result_cache import cached_result
+
+# Horizontal resolution of the timeline, legs closer together than one step are drawn as one bar
+TIMELINE_RESOLUTION = 1000
+# Colour of each geofence status, 'Mixed' is a merged bar holding legs of more than one status
+TIMELINE_COLORS = {
+    'Within Geofence': 'skyblue',
+    'Partly Out of Geofence': 'gold',
+    'Out of Geofence': 'orange',
+    'Mixed': 'gray',
+}
+
+
+# Function to merge each vehicle's adjacent legs that are closer together than the merge gap, in one vectorized pass
+@cached_result
+def decimate_legs(df, merge_gap):
+    legs = df[df['Start Time'].notnull() & df['End Time'].notnull()]
+    legs = pd.DataFrame({
+        'Registration': legs['Registration'],
+        'Start Time': legs['Start Time'],
+        'End Time': legs['End Time'],
+        'Distance': legs['Distance'].fillna(0),
+        'Geofence Status': get_geofence_status(legs),
+    }).sort_values(['Registration', 'Start Time'], kind='mergesort')
+
+    # A new bar starts at a vehicle's first leg and after every dwell gap longer than the merge gap
+    previous_end = legs.groupby('Registration')['End Time'].cummax().shift()
+    new_bar = (legs['Registration'] != legs['Registration'].shift()) | (legs['Start Time'] - previous_end > merge_gap)
+    bar_number = new_bar.cumsum()
+
+    bars = legs.groupby(bar_number).agg(**{
+        'Registration': ('Registration', 'first'),
+        'Start Time': ('Start Time', 'min'),
+        'End Time': ('End Time', 'max'),
+        'Trips': ('Distance', 'size'),
+        'Distance': ('Distance', 'sum'),
+        'Geofence Status': ('Geofence Status', 'first'),
+        'Statuses': ('Geofence Status', 'nunique'),
+    })
+    bars['Geofence Status'] = bars['Geofence Status'].where(bars['Statuses'] == 1, 'Mixed')
+    return bars.drop(columns='Statuses').reset_index(drop=True)
+
+
+# Function to get the merge gap for a time window, so the number of bars per vehicle stays under the resolution
+def get_merge_gap(window_start, window_end, resolution=TIMELINE_RESOLUTION):
+    return (pd.Timestamp(window_end) - pd.Timestamp(window_start)) / resolution
+
+
+def draw_vehicle_timeline(df, registrations, window_start, window_end):
+    timeline_df = df[df['Registration'].isin(registrations)]
+    if timeline_df.empty:
+        st.warning("No trips found for the selected registration numbers.")
+        return
+
+    merge_gap = get_merge_gap(window_start, window_end)
+    bars = decimate_legs(timeline_df, merge_gap)
+
+    # One row per registration number, bars too short to see are widened to the merge gap
+    fig, ax = plt.subplots(figsize=(12, max(2, len(registrations) * 0.5)))
+    bar_groups = list(bars.groupby('Registration'))
+    for row, (registration, registration_bars) in enumerate(bar_groups):
+        starts = mdates.date2num(registration_bars['Start Time'])
+        widths = np.maximum(mdates.date2num(registration_bars['End Time']) - starts, merge_gap / pd.Timedelta(days=1))
+        colors = registration_bars['Geofence Status'].map(TIMELINE_COLORS)
+        ax.broken_barh(list(zip(starts, widths)), (row - 0.4, 0.8), facecolors=list(colors))
+
+    ax.set_yticks(range(len(bar_groups)))
+    ax.set_yticklabels([registration for registration, _ in bar_groups])
+    ax.xaxis_date()
+    ax.set_xlabel('Start Time')
+    ax.set_title('Vehicle Timeline')
+    ax.legend(handles=[plt.Rectangle((0, 0), 1, 1, color=color) for color in TIMELINE_COLORS.values()], labels=list(TIMELINE_COLORS), loc='upper right', fontsize=8)
+    st.pyplot(fig)
+
+    st.write(f"{len(timeline_df)} legs drawn as {len(bars)} bars, legs less than {merge_gap.round('s')} apart are merged. Gaps between bars are dwell time.")
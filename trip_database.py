@@ -0,0 +1,162 @@
+import sqlite3
+import sys
+from contextlib import closing
+
+import pandas as pd
+
+from ledger import add_ledger_costs, get_geofence_status
+from time_index import get_date_range_bounds
+from validation import read_valid_trips
+
+# SQL column for each trip table column
+TRIP_DATABASE_COLUMNS = {
+    'Start Time': 'start_time',
+    'Start Location': 'start_location',
+    'Start Geofence': 'start_geofence',
+    'End Time': 'end_time',
+    'End Location': 'end_location',
+    'End Geofence': 'end_geofence',
+    'Distance': 'distance',
+    'Registration': 'registration',
+    'Geofence Status': 'geofence_status',
+}
+
+TRIP_DATABASE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS trips (
+    start_time TEXT,
+    start_location TEXT,
+    start_geofence TEXT,
+    end_time TEXT,
+    end_location TEXT,
+    end_geofence TEXT,
+    distance REAL,
+    registration TEXT,
+    geofence_status TEXT
+);
+CREATE INDEX IF NOT EXISTS trips_registration ON trips (registration, start_location, start_time);
+CREATE INDEX IF NOT EXISTS trips_start_location ON trips (start_location);
+CREATE INDEX IF NOT EXISTS trips_start_time ON trips (start_time);
+CREATE INDEX IF NOT EXISTS trips_geofence_status ON trips (geofence_status, registration);
+"""
+
+# Rows written to the database at a time
+TRIP_DATABASE_CHUNK_SIZE = 100000
+
+
+# Function to build the trip database from a trip CSV, only trips passing the data quality checks are written, in chunks
+def build_trip_database(csv_path, database_path, chunk_size=TRIP_DATABASE_CHUNK_SIZE):
+    valid_df = read_valid_trips(csv_path)
+    with closing(sqlite3.connect(database_path)) as connection:
+        connection.execute("DROP TABLE IF EXISTS trips")
+        connection.executescript(TRIP_DATABASE_SCHEMA)
+        for chunk_start in range(0, len(valid_df), chunk_size):
+            chunk = valid_df.iloc[chunk_start:chunk_start + chunk_size].copy()
+            chunk['Start Time'] = chunk['Start Time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            chunk['End Time'] = chunk['End Time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            chunk['Geofence Status'] = get_geofence_status(chunk)
+            chunk = chunk[list(TRIP_DATABASE_COLUMNS)].rename(columns=TRIP_DATABASE_COLUMNS)
+            chunk.to_sql('trips', connection, if_exists='append', index=False)
+        connection.execute("ANALYZE")
+        connection.commit()
+
+
+# Function to open the trip database read-only, every query opens its own connection so sessions do not share one
+def connect_trip_database(database_path):
+    return closing(sqlite3.connect(f'file:{database_path}?mode=ro', uri=True))
+
+
+# Function to build the WHERE clause for the given filters, None means no filter
+def build_trip_filter(registration=None, start_location=None, geofence_status=None, date_range=None):
+    conditions = []
+    parameters = []
+    for column, value in [('registration', registration), ('start_location', start_location), ('geofence_status', geofence_status)]:
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    # Start times are stored as sortable text, so a date range is a range scan on the start_time index
+    if date_range is not None:
+        range_start, range_end = get_date_range_bounds(*date_range)
+        conditions.append("start_time >= ? AND start_time < ?")
+        parameters += [range_start.strftime('%Y-%m-%d %H:%M:%S'), range_end.strftime('%Y-%m-%d %H:%M:%S')]
+    where_clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    return where_clause, parameters
+
+
+# Function to read the trips matching the filters, in Start Time order
+def query_trips(database_path, registration=None, start_location=None, geofence_status=None, date_range=None, limit=None):
+    where_clause, parameters = build_trip_filter(registration, start_location, geofence_status, date_range)
+    query = f"SELECT * FROM trips {where_clause} ORDER BY start_time"
+    if limit is not None:
+        query += " LIMIT ?"
+        parameters.append(limit)
+
+    with connect_trip_database(database_path) as connection:
+        trips_df = pd.read_sql_query(query, connection, params=parameters)
+    trips_df = trips_df.rename(columns={value: key for key, value in TRIP_DATABASE_COLUMNS.items()})
+    trips_df['Start Time'] = pd.to_datetime(trips_df['Start Time'])
+    trips_df['End Time'] = pd.to_datetime(trips_df['End Time'])
+    trips_df['Start Month'] = trips_df['Start Time'].dt.month_name()
+    return trips_df
+
+
+# Function to get the first and last trip start dates, two lookups on the start_time index
+def query_start_date_bounds(database_path):
+    with connect_trip_database(database_path) as connection:
+        first_start_time, last_start_time = connection.execute("SELECT MIN(start_time), MAX(start_time) FROM trips").fetchone()
+    return pd.Timestamp(first_start_time).date(), pd.Timestamp(last_start_time).date()
+
+
+# Function to get the distinct values of a column in order, e.g. the registration numbers for a dropdown
+def query_distinct_values(database_path, column):
+    with connect_trip_database(database_path) as connection:
+        rows = connection.execute(f"SELECT DISTINCT {TRIP_DATABASE_COLUMNS[column]} FROM trips WHERE {TRIP_DATABASE_COLUMNS[column]} IS NOT NULL ORDER BY 1").fetchall()
+    return [row[0] for row in rows]
+
+
+# Function to calculate trips, distance and costs per month inside the database
+def query_cost_ledger_per_month(database_path, registration=None, start_location=None, geofence_status=None, date_range=None, cost_rates=None):
+    where_clause, parameters = build_trip_filter(registration, start_location, geofence_status, date_range)
+    query = f"""
+        SELECT substr(start_time, 1, 7) AS month, COUNT(*) AS trips, TOTAL(distance) AS distance
+        FROM trips {where_clause}
+        GROUP BY month
+        ORDER BY month
+    """
+    with connect_trip_database(database_path) as connection:
+        ledger = pd.read_sql_query(query, connection, params=parameters)
+
+    ledger = pd.DataFrame({
+        'Start Month': pd.to_datetime(ledger['month'], format='%Y-%m').dt.strftime('%B %Y'),
+        'Total Trips': ledger['trips'],
+        'Total Distance Covered (km)': ledger['distance'],
+    })
+    return add_ledger_costs(ledger, cost_rates)
+
+
+# Function to calculate fuel costs and percentages inside the database, same result as calculate_fuel_costs
+def query_fuel_costs(database_path, registration=None, date_range=None, cost_rates=None):
+    where_clause, parameters = build_trip_filter(registration, date_range=date_range)
+    query = f"SELECT geofence_status, COUNT(*) AS trips, TOTAL(distance) AS distance FROM trips {where_clause} GROUP BY geofence_status"
+    with connect_trip_database(database_path) as connection:
+        status_df = pd.read_sql_query(query, connection, params=parameters)
+
+    status_df = status_df.rename(columns={'trips': 'Total Trips', 'distance': 'Total Distance Covered (km)'})
+    status_df = add_ledger_costs(status_df, cost_rates).set_index('geofence_status')
+    fuel_cost = status_df['Total Fuel Cost (TZS)']
+
+    on_route_fuel_cost = fuel_cost.get('Within Geofence', 0)
+    out_of_route_fuel_cost = fuel_cost.get('Out of Geofence', 0)
+    total_fuel_cost = on_route_fuel_cost + out_of_route_fuel_cost
+
+    # Calculate percentages, a selection with no fuel cost has none to split
+    if total_fuel_cost == 0:
+        return on_route_fuel_cost, out_of_route_fuel_cost, float('nan'), float('nan')
+    percentage_on_route = (on_route_fuel_cost / total_fuel_cost) * 100
+    percentage_out_of_route = (out_of_route_fuel_cost / total_fuel_cost) * 100
+
+    return on_route_fuel_cost, out_of_route_fuel_cost, percentage_on_route, percentage_out_of_route
+
+
+if __name__ == "__main__":
+    # Usage: python trip_database.py clean_tripdd.csv clean_tripdd.sqlite
+    build_trip_database(sys.argv[1], sys.argv[2])
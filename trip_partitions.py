@@ -0,0 +1,111 @@
+import os
+import shutil
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import pandas as pd
+
+from time_index import get_date_range_bounds
+from validation import read_valid_trips
+
+# Manifest written last, listing every partition with its month, registration number and trip count
+PARTITION_MANIFEST = 'manifest.csv'
+# Month partition for trips without a Start Time, never part of a date range
+NO_MONTH_PARTITION = 'none'
+# Partition files read at the same time
+PARTITION_READ_WORKERS = 8
+# Rows written to the partitions at a time
+PARTITION_CHUNK_SIZE = 100000
+
+
+# Function to get the path of a partition relative to the partition root, e.g. month=2023-10/registration=T452EBA.csv
+def get_partition_path(month, registration):
+    return os.path.join(f'month={month}', f"registration={quote(str(registration), safe='')}.csv")
+
+
+# Function to write a trip CSV as one file per month and registration number, only trips passing the data quality checks are written, in chunks
+def write_trip_partitions(csv_path, partition_root, chunk_size=PARTITION_CHUNK_SIZE):
+    valid_df = read_valid_trips(csv_path)
+    if os.path.exists(partition_root):
+        shutil.rmtree(partition_root)
+    os.makedirs(partition_root)
+
+    partition_trips = {}
+    for chunk_start in range(0, len(valid_df), chunk_size):
+        chunk = valid_df.iloc[chunk_start:chunk_start + chunk_size]
+        months = chunk['Start Time'].dt.strftime('%Y-%m').fillna(NO_MONTH_PARTITION)
+        for (month, registration), partition_df in chunk.groupby([months, chunk['Registration']], sort=False):
+            partition_path = get_partition_path(month, registration)
+            full_path = os.path.join(partition_root, partition_path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            # Later chunks append to the partition, the header is only written once
+            partition_df.to_csv(full_path, mode='a', header=partition_path not in partition_trips, index=False)
+            trips_so_far = partition_trips.get(partition_path, (month, registration, 0))[2]
+            partition_trips[partition_path] = (month, registration, trips_so_far + len(partition_df))
+
+    manifest = pd.DataFrame(
+        [(month, registration, partition_path, trips) for partition_path, (month, registration, trips) in partition_trips.items()],
+        columns=['Month', 'Registration', 'Path', 'Trips'],
+    ).sort_values(['Month', 'Registration'])
+    manifest.to_csv(os.path.join(partition_root, PARTITION_MANIFEST), index=False)
+    return manifest
+
+
+def read_partition_manifest(partition_root):
+    return pd.read_csv(os.path.join(partition_root, PARTITION_MANIFEST), dtype={'Month': str, 'Registration': str})
+
+
+# Function to get the registration numbers in the partitions, from the manifest alone
+def list_partition_registrations(partition_root):
+    return sorted(read_partition_manifest(partition_root)['Registration'].unique())
+
+
+# Function to get the first and last day of the months the partitions cover, from the manifest alone
+def get_partition_date_bounds(partition_root):
+    months = read_partition_manifest(partition_root)['Month']
+    months = months[months != NO_MONTH_PARTITION]
+    return pd.Period(months.min(), freq='M').start_time.date(), pd.Period(months.max(), freq='M').end_time.date()
+
+
+# Function to list the partition files a query needs, pruned by registration number and the months of a date range
+def list_trip_partitions(partition_root, registration=None, date_range=None):
+    manifest = read_partition_manifest(partition_root)
+    partition_mask = pd.Series(True, index=manifest.index)
+    if registration is not None:
+        partition_mask &= manifest['Registration'] == registration
+    if date_range is not None:
+        range_start, range_end = get_date_range_bounds(*date_range)
+        # Month keys are YYYY-MM text, so they compare in date order
+        first_month = range_start.strftime('%Y-%m')
+        last_month = (range_end - pd.Timedelta(days=1)).strftime('%Y-%m')
+        partition_mask &= (manifest['Month'] >= first_month) & (manifest['Month'] <= last_month) & (manifest['Month'] != NO_MONTH_PARTITION)
+    return [os.path.join(partition_root, partition_path) for partition_path in manifest.loc[partition_mask, 'Path']]
+
+
+# Function to read the trips matching the filters from only the partitions they can be in, in Start Time order
+def read_trip_partitions(partition_root, registration=None, start_location=None, date_range=None, max_workers=PARTITION_READ_WORKERS):
+    partition_paths = list_trip_partitions(partition_root, registration, date_range)
+    if not partition_paths:
+        trips_df = pd.read_csv(os.path.join(partition_root, read_partition_manifest(partition_root)['Path'].iloc[0]), nrows=0)
+    else:
+        # Reading a CSV releases the GIL for most of its work, so threads read partitions in parallel
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            trips_df = pd.concat(executor.map(pd.read_csv, partition_paths), ignore_index=True)
+
+    trips_df['Start Time'] = pd.to_datetime(trips_df['Start Time'])
+    trips_df['End Time'] = pd.to_datetime(trips_df['End Time'])
+    # Month pruning is coarse, the date range still applies within the first and last month
+    if date_range is not None:
+        range_start, range_end = get_date_range_bounds(*date_range)
+        trips_df = trips_df[(trips_df['Start Time'] >= range_start) & (trips_df['Start Time'] < range_end)]
+    if start_location is not None:
+        trips_df = trips_df[trips_df['Start Location'] == start_location]
+    trips_df = trips_df.sort_values('Start Time', kind='mergesort').reset_index(drop=True)
+    trips_df['Start Month'] = trips_df['Start Time'].dt.month_name()
+    return trips_df
+
+
+if __name__ == "__main__":
+    # Usage: python trip_partitions.py clean_tripdd.csv clean_tripdd_partitions
+    write_trip_partitions(sys.argv[1], sys.argv[2])
@@ -0,0 +1,102 @@
+import numpy as np
+
+from time_index import get_date_range_bounds, slice_date_range
+
+
+# Lazy query over the trips: filters are only recorded until collect(), then run as one index lookup and one mask
+class TripQuery:
+    # The source is a trip frame, or a time index from build_time_index so registration and date range become binary searches
+    def __init__(self, source, filters=None, row_limit=None, parent=None):
+        self.source = source
+        self.filters = filters or {}
+        self.row_limit = row_limit
+        self.parent = parent
+        self.result = None
+
+    # Function to get a new query with one more filter, the query it was made from is left unchanged
+    def where(self, **filters):
+        return TripQuery(self.source, {**self.filters, **filters})
+
+    def registration(self, registration):
+        return self.where(registration=registration)
+
+    def start_location(self, start_location):
+        return self.where(start_location=start_location)
+
+    # Status as in get_geofence_status: 'Within Geofence', 'Out of Geofence' or 'Partly Out of Geofence'
+    def geofence_status(self, geofence_status):
+        return self.where(geofence_status=geofence_status)
+
+    # Trips whose Start or End Geofence is null, e.g. 'Start Geofence' for the trips that started out of geofence
+    def out_of_geofence(self, geofence_column):
+        return self.where(out_of_geofence=geofence_column)
+
+    def date_range(self, start_date, end_date):
+        return self.where(date_range=(start_date, end_date))
+
+    def day_of_week(self, day_name):
+        return self.where(day_of_week=day_name)
+
+    # Function to get the first rows of this query, taken from this query's result so the filters only run once
+    def limit(self, row_limit):
+        return TripQuery(self.source, self.filters, row_limit, parent=self)
+
+    # Function to run the query, the result is kept so every table and chart built from this query shares it
+    def collect(self):
+        if self.result is None:
+            if self.parent is not None:
+                self.result = self.parent.collect().head(self.row_limit)
+            else:
+                self.result = self.execute()
+        return self.result
+
+    def count(self):
+        return len(self.collect())
+
+    # Function to apply a function, e.g. a per-month aggregation, to the query result
+    def aggregate(self, function, *args):
+        return function(self.collect(), *args)
+
+    def execute(self):
+        filters = dict(self.filters)
+        if isinstance(self.source, dict):
+            # Registration number and date range are looked up in the time index, the other filters mask what is left
+            date_range = filters.pop('date_range', None)
+            registration = filters.pop('registration', None)
+            if date_range is not None:
+                df = slice_date_range(self.source, *date_range, registration)
+            elif registration is not None:
+                registration_index = self.source['registrations'].get(registration)
+                df = self.source['df'].iloc[registration_index[1] if registration_index is not None else []]
+            else:
+                df = self.source['df']
+        else:
+            df = self.source
+
+        masks = [mask for mask in (self.build_mask(df, name, value) for name, value in filters.items()) if mask is not None]
+        if masks:
+            df = df[np.logical_and.reduce(masks)]
+        return df
+
+    # Function to build the boolean array for one filter
+    def build_mask(self, df, name, value):
+        if name == 'registration':
+            return (df['Registration'] == value).to_numpy()
+        if name == 'start_location':
+            return (df['Start Location'] == value).to_numpy()
+        if name == 'out_of_geofence':
+            return df[value].isnull().to_numpy()
+        if name == 'geofence_status':
+            start_out = df['Start Geofence'].isnull().to_numpy()
+            end_out = df['End Geofence'].isnull().to_numpy()
+            if value == 'Within Geofence':
+                return ~start_out & ~end_out
+            if value == 'Out of Geofence':
+                return start_out & end_out
+            return start_out != end_out
+        if name == 'date_range':
+            range_start, range_end = get_date_range_bounds(*value)
+            return ((df['Start Time'] >= range_start) & (df['Start Time'] < range_end)).to_numpy()
+        if name == 'day_of_week':
+            return (df['Start Time'].dt.day_name() == value).to_numpy()
+        raise ValueError(f"Unknown trip filter: {name}")
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from paginated_table import draw_paginated_table
+from result_cache import cached_result
+
+# Fastest average speed a field vehicle can plausibly keep over a trip (km/h)
+VALIDATION_MAX_SPEED_KMH = 150
+# Columns that identify a leg, two rows with the same values are the same leg recorded twice
+VALIDATION_LEG_KEYS = ['Registration', 'Start Time', 'End Time']
+
+
+# Function to run every row check as a vectorized boolean column, True marks a failed check
+def run_row_checks(df, max_speed_kmh=VALIDATION_MAX_SPEED_KMH):
+    duration_hours = (df['End Time'] - df['Start Time']).dt.total_seconds() / 3600
+    # Trips with no duration but some distance get an infinite speed
+    with np.errstate(divide='ignore', invalid='ignore'):
+        speed = df['Distance'] / duration_hours
+    return pd.DataFrame({
+        'Missing Time': df['Start Time'].isnull() | df['End Time'].isnull(),
+        'End Before Start': df['End Time'] < df['Start Time'],
+        'Missing Distance': df['Distance'].isnull(),
+        'Negative Distance': df['Distance'] < 0,
+        'Impossible Speed': (speed > max_speed_kmh) & (duration_hours >= 0),
+        'Duplicate Leg': df.duplicated(VALIDATION_LEG_KEYS),
+    }, index=df.index)
+
+
+# Function to flag legs that start before the same vehicle's earlier legs have ended, with one sort and a sweep
+def find_overlapping_legs(df):
+    legs = df[df['Start Time'].notnull() & df['End Time'].notnull() & ~df.duplicated(VALIDATION_LEG_KEYS)]
+    legs = legs.sort_values(['Registration', 'Start Time', 'End Time'], kind='mergesort')
+    # Latest End Time of all the vehicle's earlier legs, a leg starting before it overlaps one of them
+    latest_previous_end = legs.groupby('Registration')['End Time'].cummax().groupby(legs['Registration']).shift()
+    overlapping = legs['Start Time'] < latest_previous_end
+    return overlapping.reindex(df.index, fill_value=False)
+
+
+# Function to validate the trips at load time, failing rows are moved to a quarantine table with the checks they failed
+@cached_result
+def validate_trips(df, max_speed_kmh=VALIDATION_MAX_SPEED_KMH):
+    checks = run_row_checks(df, max_speed_kmh)
+    checks['Overlapping Leg'] = find_overlapping_legs(df)
+
+    failed = checks.any(axis=1)
+    check_counts = checks.sum().rename_axis('Check').reset_index(name='Trips')
+
+    quarantine_df = df[failed].copy()
+    # Names of the failed checks joined one check column at a time, so a large quarantine is not built row by row
+    failed_checks = pd.Series('', index=quarantine_df.index)
+    for check, check_failed in checks[failed].items():
+        failed_checks = failed_checks.where(~check_failed, failed_checks + np.where(failed_checks == '', '', ', ') + check)
+    quarantine_df['Failed Checks'] = failed_checks
+    return df[~failed], quarantine_df, check_counts
+
+
+
+# Function to read a trip CSV and keep the rows passing every check, for the trip stores built outside the dashboard.
+# Duplicate and overlapping legs are found across all of a vehicle's legs, so the whole export is validated at once
+def read_valid_trips(csv_path):
+    df = pd.read_csv(csv_path)
+    df['Start Time'] = pd.to_datetime(df['Start Time'])
+    df['End Time'] = pd.to_datetime(df['End Time'])
+    valid_df, _, _ = validate_trips(df)
+    return valid_df
+
+
+def draw_validation_report(total_trips, quarantine_df, check_counts):
+    st.subheader("Data Quality:")
+    st.write(f"{len(quarantine_df)} of {total_trips} trips were quarantined and are left out of every view.")
+    st.table(check_counts)
+
+    if not quarantine_df.empty:
+        st.subheader("Quarantined Trips:")
+        quarantine_table = quarantine_df[['Registration', 'Start Time', 'End Time', 'Start Location', 'End Location', 'Distance', 'Failed Checks']]
+        draw_paginated_table(quarantine_table, 'quarantine', sort_columns=['Registration', 'Start Time', 'Failed Checks'])
@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from ledger import calculate_fuel_cost_series
+from result_cache import cached_result
+
+
+# Function to index the trips by location once, so a scenario only flips the trips at the locations it adds
+@cached_result
+def build_location_trip_index(df, cost_rates=None):
+    location_codes, locations = pd.factorize(pd.concat([df['Start Location'], df['End Location']]))
+    start_codes = location_codes[:len(df)]
+    end_codes = location_codes[len(df):]
+
+    # Trip positions grouped by location code: the trips at location i are positions[offsets[i]:offsets[i + 1]], missing locations sort first and are skipped
+    def group_positions(codes):
+        positions = np.argsort(codes, kind='stable')
+        offsets = np.searchsorted(codes[positions], np.arange(len(locations) + 1))
+        return positions, offsets
+
+    start_in_geofence = df['Start Geofence'].notnull().to_numpy()
+    end_in_geofence = df['End Geofence'].notnull().to_numpy()
+    # Locations visited outside any geofence, most visited first, are the candidates for new geofences, missing ones (-1) never are
+    out_of_geofence_codes = np.concatenate([start_codes[~start_in_geofence], end_codes[~end_in_geofence]])
+    out_of_geofence_visits = np.bincount(out_of_geofence_codes[out_of_geofence_codes >= 0], minlength=len(locations))
+    candidate_codes = np.argsort(-out_of_geofence_visits, kind='stable')
+    candidate_codes = candidate_codes[out_of_geofence_visits[candidate_codes] > 0]
+
+    return {
+        'locations': locations,
+        'location_codes': {location: code for code, location in enumerate(locations)},
+        'candidates': list(locations[candidate_codes]),
+        'start_positions': group_positions(start_codes),
+        'end_positions': group_positions(end_codes),
+        'start_in_geofence': start_in_geofence,
+        'end_in_geofence': end_in_geofence,
+        'fuel_cost': calculate_fuel_cost_series(df['Distance'], cost_rates).to_numpy(),
+    }
+
+
+# Function to get the positions of the trips at the given locations
+def get_location_positions(grouped_positions, codes):
+    positions, offsets = grouped_positions
+    if not codes:
+        return positions[:0]
+    return np.concatenate([positions[offsets[code]:offsets[code + 1]] for code in codes])
+
+
+# Function to recalculate geofence status and fuel costs as if the given locations were inside a geofence
+def simulate_geofence_scenario(location_trip_index, added_locations):
+    codes = [location_trip_index['location_codes'][location] for location in added_locations if location in location_trip_index['location_codes']]
+    start_in_geofence = location_trip_index['start_in_geofence'].copy()
+    end_in_geofence = location_trip_index['end_in_geofence'].copy()
+    start_in_geofence[get_location_positions(location_trip_index['start_positions'], codes)] = True
+    end_in_geofence[get_location_positions(location_trip_index['end_positions'], codes)] = True
+
+    on_route = start_in_geofence & end_in_geofence
+    out_of_route = ~start_in_geofence & ~end_in_geofence
+    fuel_cost = location_trip_index['fuel_cost']
+    on_route_fuel_cost = fuel_cost[on_route].sum()
+    out_of_route_fuel_cost = fuel_cost[out_of_route].sum()
+    total_fuel_cost = on_route_fuel_cost + out_of_route_fuel_cost
+
+    return {
+        'Within Geofence Trips': int(on_route.sum()),
+        'Out of Geofence Trips': int(out_of_route.sum()),
+        'Partly Out of Geofence Trips': int(len(on_route) - on_route.sum() - out_of_route.sum()),
+        'Within Geofence Fuel Cost (TZS)': round(on_route_fuel_cost),
+        'Out of Geofence Fuel Cost (TZS)': round(out_of_route_fuel_cost),
+        'Out of Geofence Fuel (%)': round(out_of_route_fuel_cost / total_fuel_cost * 100, 2) if total_fuel_cost else float('nan'),
+    }
+
+
+# Function to compare scenarios side by side against the current geofences
+def compare_geofence_scenarios(location_trip_index, scenarios):
+    scenario_results = {'Current Geofences': simulate_geofence_scenario(location_trip_index, [])}
+    for scenario_name, added_locations in scenarios.items():
+        scenario_results[scenario_name] = simulate_geofence_scenario(location_trip_index, added_locations)
+    comparison = pd.DataFrame.from_dict(scenario_results, orient='index')
+    comparison['Change in Out of Geofence Fuel (%)'] = (comparison['Out of Geofence Fuel (%)'] - comparison.loc['Current Geofences', 'Out of Geofence Fuel (%)']).round(2)
+    return comparison.rename_axis('Scenario')
+
+
+def draw_geofence_scenarios(comparison):
+    st.subheader("Geofence Scenarios:")
+    st.table(comparison)
+
+    # Bar chart of the out of geofence fuel share under each scenario
+    st.bar_chart(comparison[['Out of Geofence Fuel (%)']])